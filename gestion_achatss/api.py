@@ -69,8 +69,8 @@ def delete_fournisseur(fournisseur_id: int, db: Session = Depends(get_db)):
 import os
 from fastapi import FastAPI, Depends, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy import create_engine, func
-from sqlalchemy.orm import sessionmaker, Session, joinedload
+from sqlalchemy import create_engine, func, select, insert, update, bindparam, cast, Float
+from sqlalchemy.orm import sessionmaker, Session, selectinload, raiseload
 from datetime import datetime
 from typing import List, Optional
 
@@ -92,7 +92,15 @@ DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///./achats_local.db")
 if DATABASE_URL.startswith("sqlite"):
     engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
 else:
-    engine = create_engine(DATABASE_URL)
+    # Pool réutilisé entre les requêtes (pas de nouvelle connexion TLS + authentification à chaque appel) ;
+    # pas de ping à chaque emprunt, les connexions anciennes sont recyclées au bout de 30 min.
+    engine = create_engine(
+        DATABASE_URL,
+        pool_size=5,
+        max_overflow=10,
+        pool_recycle=1800,
+        pool_pre_ping=False
+    )
 
 # Crée les tables si elles n'existent pas (utile pour la première exécution en ligne)
 Base.metadata.create_all(bind=engine)
@@ -101,11 +109,9 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 # Dépendance pour obtenir la session de base de données
 def get_db():
-    db = SessionLocal()
-    try:
+    # La session rend sa connexion au pool à la sortie du bloc
+    with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 
 # ====================================================================
@@ -191,6 +197,10 @@ app.add_middleware(
 # 4. Routes de l'API (CRUD et Logique Métier)
 # ====================================================================
 
+# Colonnes renvoyées par les routes de lecture (projection : seules les colonnes des schémas *InDB sont lues)
+PRODUIT_COLUMNS = (Produit.id, Produit.nom, Produit.reference, Produit.prix_unitaire, Produit.stock_actuel)
+FOURNISSEUR_COLUMNS = (Fournisseur.id, Fournisseur.nom)
+
 # --- Route de Bienvenue (Test de l'API) ---
 @app.get("/")
 def read_root():
@@ -207,7 +217,8 @@ def create_produit(produit: ProduitBase, db: Session = Depends(get_db)):
 
 @app.get("/produits/", response_model=List[ProduitInDB])
 def read_produits(db: Session = Depends(get_db)):
-    return db.query(Produit).all()
+    # SELECT Core : lignes légères, sans instances ORM ni carte d'identité
+    return db.execute(select(*PRODUIT_COLUMNS)).all()
 
 # --- Routes Fournisseurs (Lecture et Création) ---
 @app.post("/fournisseurs/", response_model=FournisseurInDB)
@@ -220,54 +231,81 @@ def create_fournisseur(fournisseur: FournisseurBase, db: Session = Depends(get_d
 
 @app.get("/fournisseurs/", response_model=List[FournisseurInDB])
 def read_fournisseurs(db: Session = Depends(get_db)):
-    return db.query(Fournisseur).all()
+    return db.execute(select(*FOURNISSEUR_COLUMNS)).all()
 
 
 # --- Route Commande (Logique Métier : Création et Stock) ---
 @app.post("/commandes/", response_model=CommandeInDB)
 def create_commande(commande: CommandeCreate, db: Session = Depends(get_db)):
     
-    # 1. Calculer le coût total
-    cout_total = 0.0
-    for detail in commande.details:
-        cout_total += detail.quantite * detail.prix_achat
-
-    # 2. Créer l'objet Commande
+    # 1. Créer la Commande avec son coût total (flush pour obtenir son id)
     db_commande = Commande(
         fournisseur_id=commande.fournisseur_id,
         societe=commande.societe,
         statut=commande.statut,
-        cout_total=cout_total
+        cout_total=sum(detail.quantite * detail.prix_achat for detail in commande.details)
     )
     db.add(db_commande)
-    db.commit()
-    db.refresh(db_commande)
-
-    # 3. Traiter les Détails de Commande et Mettre à Jour le Stock
-    for detail in commande.details:
-        
-        # Créer le Détail de Commande
-        db_detail = DetailCommande(
-            commande_id=db_commande.id,
-            produit_id=detail.produit_id,
-            quantite=detail.quantite,
-            prix_achat=detail.prix_achat
+    db.flush()
+
+    if commande.details:
+        # 2. Insérer tous les Détails en un seul INSERT groupé (un aller-retour quel que soit le nombre de lignes).
+        #    Insertion hors unité de travail : cout_total est donc fixé ci-dessus, pas par recalculer_cout_total.
+        db.execute(insert(DetailCommande), [
+            {
+                'commande_id': db_commande.id,
+                'produit_id': detail.produit_id,
+                'quantite': detail.quantite,
+                'prix_achat': detail.prix_achat
+            }
+            for detail in commande.details
+        ])
+
+        # 3. Mettre à jour le stock des produits (Augmentation pour un achat) : un UPDATE exécuté en lot
+        produits = Produit.__table__
+        db.execute(
+            update(produits)
+            .where(produits.c.id == bindparam('produit_ref'))
+            .values(stock_actuel=produits.c.stock_actuel + bindparam('quantite_ajoutee')),
+            [{'produit_ref': detail.produit_id, 'quantite_ajoutee': detail.quantite} for detail in commande.details]
         )
-        db.add(db_detail)
-
-        # Mettre à jour le stock du produit (Augmentation pour un achat)
-        produit = db.query(Produit).filter(Produit.id == detail.produit_id).first()
-        if produit:
-            produit.stock_actuel += detail.quantite
         
     db.commit()
-    db.refresh(db_commande)
+    # Pas de refresh (qui joindrait aussi le fournisseur) : les colonnes expirées puis les détails
+    # sont rechargés à la sérialisation, seuls champs de CommandeInDB
     return db_commande
 
 @app.get("/commandes/", response_model=List[CommandeInDB])
-def read_commandes(db: Session = Depends(get_db)):
-    # Charge les détails pour que Pydantic puisse les sérialiser
-    return db.query(Commande).options(joinedload(Commande.details)).all()
+def read_commandes(
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    statut: Optional[str] = None,
+    fournisseur_id: Optional[int] = None,
+    limit: Optional[int] = None,
+    offset: int = 0,
+    db: Session = Depends(get_db)
+):
+    # Seuls les détails sont sérialisés par CommandeInDB : chargés en une requête groupée, sans dupliquer
+    # les lignes de commande comme le ferait un JOIN ; ni fournisseur ni produit ne sont chargés.
+    # raiseload('*') : tout autre accès paresseux lève une erreur au lieu d'ajouter un SELECT par ligne.
+    query = db.query(Commande).options(
+        selectinload(Commande.details),
+        raiseload('*')
+    )
+    # Filtres optionnels appliqués en SQL (WHERE) : seules les commandes affichées sont renvoyées
+    if date_from is not None:
+        query = query.filter(Commande.date_commande >= date_from)
+    if date_to is not None:
+        query = query.filter(Commande.date_commande <= date_to)
+    if statut:
+        query = query.filter(Commande.statut == statut)
+    if fournisseur_id is not None:
+        query = query.filter(Commande.fournisseur_id == fournisseur_id)
+    # Pagination optionnelle : les plus récentes d'abord, une page à la fois
+    query = query.order_by(Commande.date_commande.desc(), Commande.id.desc()).offset(offset)
+    if limit is not None:
+        query = query.limit(limit)
+    return query.all()
 
 
 # --- Route Statistiques ---
@@ -278,22 +316,13 @@ def get_produit_stats(db: Session = Depends(get_db)):
     # 2. Grouper par produit (nom)
     # 3. Calculer la somme des quantités (quantite_vendue)
     # 4. Calculer la somme du coût total (prix_achat * quantite) (revenu_total)
-    stats = db.query(
+    # 5. Conversion en flottants faite en SQL (CAST) : les lignes sont renvoyées telles quelles
+    stmt = select(
         Produit.nom.label('nom_produit'),
-        func.sum(DetailCommande.quantite).label('quantite_vendue'),
-        func.sum(DetailCommande.prix_achat * DetailCommande.quantite).label('revenu_total')
+        cast(func.sum(DetailCommande.quantite), Float).label('quantite_vendue'),
+        cast(func.sum(DetailCommande.prix_achat * DetailCommande.quantite), Float).label('revenu_total')
     ).join(DetailCommande, Produit.id == DetailCommande.produit_id
-    ).group_by(Produit.nom
-    ).all()
-    
-    # Convertir les résultats en une liste de dictionnaires
-    results = [
-        {
-            "nom_produit": row.nom_produit,
-            "quantite_vendue": float(row.quantite_vendue),
-            "revenu_total": float(row.revenu_total)
-        }
-        for row in stats
-    ]
+    ).group_by(Produit.nom)
     
-    return results
\ No newline at end of file
+    # Lignes Core sous forme de dictionnaires (pas d'objets ORM intermédiaires)
+    return db.execute(stmt).mappings().all()
@@ -426,13 +426,24 @@ def show_client_form():
 import streamlit as st
 import hashlib
 import pandas as pd
+import numpy as np
 from datetime import datetime, timedelta
 import plotly.express as px
 import io
+import json
 import base64
+from operator import itemgetter
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from requests.exceptions import RequestException
 
+try:
+    from numba import njit, types
+    from numba.typed import Dict
+except ImportError: # numba est optionnel : sans lui, les statistiques restent sur le chemin pandas
+    njit = None
+
 # Configuration de la page
 st.set_page_config(
     page_title="Gestion des Achats",
@@ -442,21 +453,33 @@ st.set_page_config(
 # --- Constantes ---
 NUMERO_PAIEMENT = "+221773867580"
 DEFAULT_COUNTRY_CODE = "+221" # Indicatif par défaut (Sénégal)
+# Statuts possibles d'une commande (ordre d'affichage) et position de chacun pour les sélecteurs
+STATUS_CHOICES = ("En attente", "Confirmée", "Reçue", "Annulée")
+STATUS_INDEX = {status: i for i, status in enumerate(STATUS_CHOICES)}
 
 # *** MODIFICATION CRITIQUE ICI : URL DE L'API RENDER ***
 FASTAPI_BASE_URL = "https://gestion-achatss-io.onrender.com" 
 # ********************************************************
+# (connexion, lecture) en secondes : évite de bloquer l'interface pendant un démarrage à froid de Render
+API_TIMEOUT = (3.05, 10)
 
 
 # ----------------------------------------------------------------------
 # --- FONCTIONS CRITIQUES D'INTERACTION AVEC L'API FASTAPI/RENDER ---
 # ----------------------------------------------------------------------
 
-@st.cache_data(ttl=60) # Mettre en cache pour 60 secondes pour éviter les appels API excessifs
-def get_data_from_api(endpoint):
-    """Récupère les données d'un point de terminaison de l'API (GET)."""
+@st.cache_resource
+def get_http_session():
+    """Session HTTP partagée (keep-alive) : réutilise les connexions TLS vers l'API entre les appels et les reruns."""
+    session = requests.Session()
+    session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=2))
+    session.headers.update({'Content-Type': 'application/json', 'accept': 'application/json'})
+    return session
+
+def _fetch_api_json(session, endpoint):
+    """GET brut (sans cache Streamlit) : utilisable depuis un thread de travail."""
     try:
-        response = requests.get(f"{FASTAPI_BASE_URL}{endpoint}")
+        response = session.get(f"{FASTAPI_BASE_URL}{endpoint}", timeout=API_TIMEOUT)
         response.raise_for_status() # Lève une exception pour les codes d'erreur 4xx/5xx
         return response.json()
     except RequestException as e:
@@ -464,21 +487,37 @@ def get_data_from_api(endpoint):
         # st.error(f"Erreur de connexion à l'API pour {endpoint}: {e}") # Désactiver cette erreur pour ne pas spammer l'utilisateur
         return None
 
+@st.cache_data(ttl=60) # Mettre en cache pour 60 secondes pour éviter les appels API excessifs
+def get_data_from_api(endpoint):
+    """Récupère les données d'un point de terminaison de l'API (GET)."""
+    return _fetch_api_json(get_http_session(), endpoint)
+
+# Points de terminaison lus par les onglets de l'espace client
+API_LIST_ENDPOINTS = ("/produits/", "/fournisseurs/", "/commandes/")
+
+@st.cache_data(ttl=60)
+def load_all_api_data():
+    """Récupère produits, fournisseurs et commandes en parallèle (un aller-retour au lieu de trois à froid)."""
+    session = get_http_session() # Récupérée dans le thread principal (contexte Streamlit)
+    with ThreadPoolExecutor(max_workers=len(API_LIST_ENDPOINTS)) as executor:
+        payloads = executor.map(lambda endpoint: _fetch_api_json(session, endpoint), API_LIST_ENDPOINTS)
+        return dict(zip(API_LIST_ENDPOINTS, payloads))
+
 def handle_api_request(method, endpoint, data=None):
     """
     Gère les requêtes API POST, PUT, DELETE et retourne la réponse JSON.
     Retourne un tuple (success, data_or_error_message).
     """
     url = f"{FASTAPI_BASE_URL}{endpoint}"
-    headers = {'Content-Type': 'application/json', 'accept': 'application/json'}
+    session = get_http_session() # En-têtes JSON déjà définis sur la session
     
     try:
         if method == 'POST':
-            response = requests.post(url, json=data, headers=headers)
+            response = session.post(url, json=data, timeout=API_TIMEOUT)
         elif method == 'PUT':
-            response = requests.put(url, json=data, headers=headers)
+            response = session.put(url, json=data, timeout=API_TIMEOUT)
         elif method == 'DELETE':
-            response = requests.delete(url, headers=headers)
+            response = session.delete(url, timeout=API_TIMEOUT)
         else:
             return False, f"Méthode {method} non supportée."
 
@@ -515,7 +554,7 @@ def handle_api_request(method, endpoint, data=None):
 @st.cache_data(ttl=60)
 def load_products_data():
     """Charge les produits depuis l'API et retourne un DataFrame vide ou rempli."""
-    data = get_data_from_api("/produits/")
+    data = load_all_api_data().get("/produits/")
     if data is None or not isinstance(data, list):
         if st.session_state.logged_in:
             # st.error("⚠️ Impossible de charger les données de produits.")
@@ -557,12 +596,11 @@ def load_products_data():
 
 
         # 4. Conversion des types
+        # Les ID restent des entiers (Int64 accepte les fournisseurs manquants) : jointures et maps sur clés int64
         if 'ID Produit' in df.columns:
-             # Assurer que l'ID est une chaîne pour la jointure
-             df['ID Produit'] = df['ID Produit'].astype(str) 
+             df['ID Produit'] = pd.to_numeric(df['ID Produit'], errors='coerce').astype('Int64')
         if 'ID Fournisseur' in df.columns:
-             # Assurer que l'ID est une chaîne pour la jointure
-             df['ID Fournisseur'] = df['ID Fournisseur'].astype(str) 
+             df['ID Fournisseur'] = pd.to_numeric(df['ID Fournisseur'], errors='coerce').astype('Int64')
             
         # S'assurer que les colonnes numériques sont au bon format
         for col_name in ['Prix Achat Unitaire (FCFA)', 'Prix Vente Unitaire (FCFA)', 'Stock Actuel']:
@@ -577,7 +615,7 @@ def load_products_data():
 @st.cache_data(ttl=60)
 def load_fournisseurs_data():
     """Charge les fournisseurs depuis l'API et retourne un DataFrame vide ou rempli."""
-    data = get_data_from_api("/fournisseurs/")
+    data = load_all_api_data().get("/fournisseurs/")
     if data is None or not isinstance(data, list):
         if st.session_state.logged_in:
              # st.error("⚠️ Impossible de charger les données de fournisseurs.")
@@ -593,16 +631,73 @@ def load_fournisseurs_data():
             'id': 'ID Fournisseur'
         })
          if 'ID Fournisseur' in df.columns:
-             # Assurer que l'ID est une chaîne pour la jointure
-             df['ID Fournisseur'] = df['ID Fournisseur'].astype(str) 
+             # Garder l'ID entier, même type que 'ID Fournisseur' côté produits
+             df['ID Fournisseur'] = pd.to_numeric(df['ID Fournisseur'], errors='coerce').astype('Int64')
              
     # Retourner le DataFrame sans définir l'index
     return df if not df.empty else pd.DataFrame()
 
+@st.cache_data(ttl=60)
+def load_fournisseurs_display():
+    """Fournisseurs prêts pour l'affichage : nom renommé, ID caché (les jointures utilisent load_fournisseurs_data)."""
+    df = load_fournisseurs_data()
+    return df.rename(columns={'Nom Fournisseur': 'Nom du Fournisseur'}).drop(columns=['ID Fournisseur'], errors='ignore')
+
+@st.cache_data(ttl=60)
+def fournisseur_options():
+    """Retourne (noms, nom -> ID, nom -> position) pour les sélecteurs de fournisseur."""
+    df = load_fournisseurs_data()
+    if df.empty or 'Nom Fournisseur' not in df.columns:
+        return [], {}, {}
+    names = df['Nom Fournisseur'].tolist()
+    ids = df['ID Fournisseur'].tolist()
+    return names, dict(zip(names, ids)), {name: i for i, name in enumerate(names)}
+
+@st.cache_data(ttl=60)
+def _product_id_to_name():
+    """Retourne le dictionnaire {ID Produit: nom} construit une seule fois à partir des produits."""
+    df_products = load_products_data()
+    if df_products.empty:
+        return {}
+    return df_products.set_index('ID Produit')['Produit'].to_dict()
+
+@st.cache_data(ttl=60)
+def load_products_display():
+    """
+    Retourne (df_display, df_by_id) : les produits joints au nom de leur fournisseur, colonnes réordonnées
+    pour l'affichage, et la même table indexée par 'ID Produit' pour les recherches par ID.
+    """
+    df_products = load_products_data()
+    df_fournisseurs = load_fournisseurs_data()
+
+    if df_products.empty:
+        return pd.DataFrame(), pd.DataFrame()
+    if df_fournisseurs.empty or 'ID Fournisseur' not in df_products.columns:
+        # Si les fournisseurs ne sont pas chargés, afficher au moins les produits
+        return df_products, df_products.set_index('ID Produit', drop=False)
+
+    # Une seule colonne à ajouter depuis une petite table : un map sur dictionnaire suffit (pas de jointure)
+    # Le nom est lu directement dans 'Nom Fournisseur' (pas de copie renommée de la table fournisseurs)
+    f_map = dict(zip(df_fournisseurs['ID Fournisseur'], df_fournisseurs['Nom Fournisseur']))
+    df_display = df_products.copy()
+    df_display['Nom du Fournisseur'] = df_display['ID Fournisseur'].map(f_map)
+    # Retirer la colonne ID Fournisseur et la remplacer par le nom
+    df_display = df_display.drop(columns=['ID Fournisseur'])
+    # Réordonner les colonnes pour un affichage plus lisible
+    cols = [
+        'ID Produit', 'Produit', 'Stock Actuel', 
+        'Prix Achat Unitaire (FCFA)', 'Prix Vente Unitaire (FCFA)', 
+        'Nom du Fournisseur'
+    ]
+    # S'assurer que seules les colonnes existantes sont utilisées pour le réordonnancement
+    cols_to_use = [col for col in cols if col in df_display.columns]
+    df_display = df_display[cols_to_use]
+    return df_display, df_display.set_index('ID Produit', drop=False)
+
 @st.cache_data(ttl=60)
 def load_commandes_data():
     """Charge les commandes depuis l'API et retourne une liste vide ou remplie."""
-    data = get_data_from_api("/commandes/")
+    data = load_all_api_data().get("/commandes/")
     if data is None or not isinstance(data, list):
         if st.session_state.logged_in:
              # st.error("⚠️ Impossible de charger les données de commandes.")
@@ -611,6 +706,24 @@ def load_commandes_data():
     
     return data
 
+@st.cache_data(ttl=60)
+def load_commandes_df():
+    """Retourne les commandes sous forme de DataFrame, avec 'date_commande' déjà convertie en datetime64."""
+    commandes_list = load_commandes_data()
+    if not commandes_list:
+        return pd.DataFrame()
+
+    df = pd.DataFrame(commandes_list)
+    # Conversion faite une seule fois ici (en cache) plutôt qu'à chaque réexécution de la page
+    # format='ISO8601' : chaque valeur est lue selon sa propre précision (l'API omet les microsecondes nulles)
+    df['date_commande'] = pd.to_datetime(df['date_commande'], format='ISO8601', errors='coerce')
+    # Garantir la présence de 'cout_total' (calculé une seule fois si l'API ne le fournit pas)
+    if 'cout_total' not in df.columns:
+        df['cout_total'] = compute_cout_total(df['details'])
+    # Peu de fournisseurs distincts : le type 'category' permet des groupby sur codes entiers
+    df['fournisseur_id'] = df['fournisseur_id'].astype('category')
+    return df
+
 # ----------------------------------------------------------------------
 # --- FIN DES FONCTIONS D'INTERACTION API ---
 # ----------------------------------------------------------------------
@@ -620,15 +733,28 @@ def make_hashes(password):
     return hashlib.sha256(str.encode(password)).hexdigest()
 
 # --- Fonctions utilitaires pour le téléchargement ---
-@st.cache_data
+def _df_digest(df):
+    """Clé de cache bon marché pour les exports : colonnes, taille et empreinte vectorisée du contenu."""
+    return (tuple(df.columns), len(df), int(pd.util.hash_pandas_object(df, index=False).sum()))
+
+# Les DataFrames d'export sont hachés via _df_digest plutôt que par le hachage par défaut de Streamlit
+EXPORT_HASH_FUNCS = {pd.DataFrame: _df_digest}
+
+@st.cache_data(hash_funcs=EXPORT_HASH_FUNCS)
+def to_csv_excel(df):
+    # CSV lisible directement par Excel (séparateur ';' et BOM UTF-8 pour les accents)
+    return df.to_csv(index=False, sep=';').encode('utf-8-sig')
+
+@st.cache_data(hash_funcs=EXPORT_HASH_FUNCS)
 def to_excel(df):
     output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
+    # constant_memory : les lignes sont écrites au fil de l'eau au lieu de garder tout le classeur en mémoire
+    with pd.ExcelWriter(output, engine='xlsxwriter', engine_kwargs={'options': {'constant_memory': True}}) as writer:
         df.to_excel(writer, index=False, sheet_name='Rapport')
     processed_data = output.getvalue()
     return processed_data
 
-@st.cache_data
+@st.cache_data(hash_funcs=EXPORT_HASH_FUNCS)
 def to_plain_text_report(df, title="Rapport"):
     report = f"\n\n*** {title.upper()} ***\n\n"
     report += df.to_string(index=False, justify='left', line_width=120)
@@ -639,14 +765,11 @@ def to_plain_text_report(df, title="Rapport"):
     if amount_col in df.columns or 'Montant Total' in df.columns:
         amount_col_final = amount_col if amount_col in df.columns else 'Montant Total'
         try:
-            # S'assurer que les valeurs sont numériques avant la somme
-            def clean_amount(x):
-                if isinstance(x, str):
-                    return x.replace(' FCFA', '').replace(',', '').strip()
-                return x
-            
-            df[amount_col_final] = df[amount_col_final].apply(clean_amount)
-            total_amount = pd.to_numeric(df[amount_col_final], errors='coerce').fillna(0).sum()
+            # S'assurer que les valeurs sont numériques avant la somme (nettoyage vectorisé via .str)
+            amounts = df[amount_col_final]
+            if amounts.dtype == object:
+                amounts = amounts.astype(str).str.replace(' FCFA', '', regex=False).str.replace(',', '', regex=False).str.strip()
+            total_amount = pd.to_numeric(amounts, errors='coerce').fillna(0).sum()
             
             report += f"\n\n---"
             report += f"\nTOTAL GÉNÉRAL DES MONTANTS: {total_amount:,.0f} FCFA\n"
@@ -661,7 +784,7 @@ def generate_download_buttons(df, filename_base):
         st.warning("Aucune donnée disponible pour le téléchargement.")
         return
 
-    col_txt, col_xlsx, _ = st.columns([1, 1, 4]) 
+    col_txt, col_csv, col_xlsx, _ = st.columns([1, 1, 1, 3]) 
 
     txt_title = filename_base.replace('_', ' ').replace('Rapport', 'Rapport').capitalize()
     
@@ -684,6 +807,15 @@ def generate_download_buttons(df, filename_base):
             type="primary"
         )
         
+    with col_csv:
+        st.download_button(
+            label="📊 Télécharger en CSV (Excel)",
+            data=to_csv_excel(df),
+            file_name=f'{filename_base}.csv',
+            mime='text/csv',
+            key=f'csv_download_{filename_base}'
+        )
+
     with col_xlsx:
         st.download_button(
             label="💾 Télécharger en XLSX",
@@ -746,14 +878,18 @@ if "USER_DB" not in st.session_state:
          if "phone_number" not in info:
              info["phone_number"] = "000000000"
 
+# Les dates des charges sont stockées en pd.Timestamp pour éviter un pd.to_datetime à chaque affichage
 if "charges_db" not in st.session_state:
     st.session_state.charges_db = [
-        {"id": 1, "nature": "Salaire", "montant": 200000.0, "date": "2025-09-19"},
-        {"id": 2, "nature": "Loyer", "montant": 150000.0, "date": "2025-09-20"},
-        {"id": 3, "nature": "Marketing", "montant": 50000.0, "date": "2025-09-21"},
+        {"id": 1, "nature": "Salaire", "montant": 200000.0, "date": pd.Timestamp("2025-09-19")},
+        {"id": 2, "nature": "Loyer", "montant": 150000.0, "date": pd.Timestamp("2025-09-20")},
+        {"id": 3, "nature": "Marketing", "montant": 50000.0, "date": pd.Timestamp("2025-09-21")},
     ]
 if "next_charge_id" not in st.session_state:
     st.session_state.next_charge_id = 4 
+# Version des charges : incrémentée à chaque ajout/modification/suppression (invalide les caches dérivés)
+if "charges_version" not in st.session_state:
+    st.session_state.charges_version = 0
 
 if "user_settings" not in st.session_state:
     st.session_state.user_settings = {}
@@ -1097,11 +1233,9 @@ def show_charge_management():
     else:
         df_charges = pd.DataFrame(st.session_state.charges_db)
         df_charges['montant'] = pd.to_numeric(df_charges['montant'], errors='coerce').fillna(0)
-        df_charges['date'] = pd.to_datetime(df_charges['date'], errors='coerce')
+        # 'date' est déjà un pd.Timestamp (voir l'initialisation de charges_db)
         df_charges = df_charges.sort_values(by="date", ascending=False).reset_index(drop=True)
         df_charges = df_charges.rename(columns={"nature": "Nature de la Charge", "montant": "Montant (FCFA)", "date": "Date"})
-        # Nettoyage des lignes avec dates invalides si nécessaire
-        df_charges = df_charges.dropna(subset=['Date']) 
 
 
     st.subheader("Historique des Charges")
@@ -1124,10 +1258,11 @@ def show_charge_management():
                     "id": st.session_state.next_charge_id,
                     "nature": new_nature,
                     "montant": new_amount,
-                    "date": new_date.strftime("%Y-%m-%d")
+                    "date": pd.Timestamp(new_date)
                 }
                 st.session_state.charges_db.append(new_charge)
                 st.session_state.next_charge_id += 1
+                st.session_state.charges_version += 1
                 st.success("Charge ajoutée avec succès !")
                 st.rerun()
             else:
@@ -1136,7 +1271,13 @@ def show_charge_management():
     st.markdown("---")
     st.subheader("Modifier ou supprimer une charge")
     if not df_charges.empty:
-        charge_options = {row['id']: f"{row['Nature de la Charge']} - {row['Montant (FCFA)'] + 0:,.0f} CFA ({row['Date'].strftime('%Y-%m-%d')})" for _, row in df_charges.iterrows()}
+        # Les libellés ne sont reconstruits que si les charges ont changé depuis le dernier rendu
+        cached_options = st.session_state.get("charges_options_cache")
+        if cached_options and cached_options[0] == st.session_state.charges_version:
+            charge_options = cached_options[1]
+        else:
+            charge_options = {row['id']: f"{row['Nature de la Charge']} - {row['Montant (FCFA)'] + 0:,.0f} CFA ({row['Date'].strftime('%Y-%m-%d')})" for _, row in df_charges.iterrows()}
+            st.session_state.charges_options_cache = (st.session_state.charges_version, charge_options)
         charge_to_modify = st.selectbox("Sélectionner une charge", options=list(charge_options.keys()), format_func=lambda x: charge_options[x], key="modify_charge_select")
 
         if charge_to_modify:
@@ -1147,7 +1288,7 @@ def show_charge_management():
                 with st.form("modify_charge_form"):
                     updated_nature = st.text_input("Nouvelle nature de la charge", value=current_charge['nature'])
                     updated_amount = st.number_input("Nouveau montant (FCFA)", value=float(current_charge['montant']), min_value=1.0)
-                    updated_date = st.date_input("Nouvelle date de la charge", value=datetime.strptime(current_charge['date'], "%Y-%m-%d").date())
+                    updated_date = st.date_input("Nouvelle date de la charge", value=current_charge['date'].date())
                     
                     col1, col2 = st.columns(2)
                     with col1:
@@ -1158,12 +1299,14 @@ def show_charge_management():
                     if modify_button:
                         st.session_state.charges_db[current_charge_index]['nature'] = updated_nature
                         st.session_state.charges_db[current_charge_index]['montant'] = updated_amount
-                        st.session_state.charges_db[current_charge_index]['date'] = updated_date.strftime("%Y-%m-%d")
+                        st.session_state.charges_db[current_charge_index]['date'] = pd.Timestamp(updated_date)
+                        st.session_state.charges_version += 1
                         st.success("Charge mise à jour avec succès !")
                         st.rerun()
                     
                     if delete_button:
                         del st.session_state.charges_db[current_charge_index]
+                        st.session_state.charges_version += 1
                         st.success("Charge supprimée avec succès !")
                         st.rerun()
 
@@ -1249,23 +1392,18 @@ def show_user_settings_page():
     st.link_button("Partager sur WhatsApp", url=f"https://wa.me/?text=Découvrez%20mon%20outil%20de%20gestion%20des%20achats%20:%20{app_link}", type="primary")
 
 # --- Fonctions de Panier (ADAPTÉES POUR L'API) --- 
-def add_to_cart(product_id, quantity, price): 
+def add_to_cart(product_id, quantity, price, name): 
     """Ajoute un produit au panier temporaire (Client-side).""" 
     # Correction : toujours stocker nom, quantité, prix dans le panier
-    df_products = load_products_data()
-    product_row = df_products[df_products['ID Produit'] == product_id]
-    if not product_row.empty:
-        product_name = product_row.iloc[0]['Produit']
-    else:
-        product_name = str(product_id)
+    # Le nom est fourni par l'appelant (déjà connu au moment de la sélection)
+    product_name = name if name else str(product_id)
     if product_id in st.session_state.cart:
         st.session_state.cart[product_id]['quantity'] += quantity
         st.session_state.cart[product_id]['price'] = price
         st.session_state.cart[product_id]['name'] = product_name
     else:
         st.session_state.cart[product_id] = {'quantity': quantity, 'price': price, 'name': product_name}
-    # Après modification du panier, on peut forcer le rafraîchissement des données produits si besoin
-    st.cache_data.clear()  # Vide le cache pour garantir la synchronisation
+    # Le panier est local : pas besoin de vider le cache ici, finalize_purchase s'en charge après l'envoi à l'API
 
 def finalize_purchase(fournisseur_id, societe): 
     """Finalise le panier actuel en une commande via l'API.""" 
@@ -1308,9 +1446,11 @@ def finalize_purchase(fournisseur_id, societe):
     success, result = handle_api_request('POST', "/commandes/", data=purchase_data) 
     
     if success: 
+        # Le total renvoyé par l'API fait foi ; à défaut, on le calcule à partir des articles envoyés
+        purchase_data['cout_total'] = result.get('cout_total', sum(a['quantite'] * a['prix_achat'] for a in articles_list))
         st.session_state.cart = {} # Vider le panier après succès 
         st.cache_data.clear() # Invalider le cache pour forcer la mise à jour des stocks et statistiques 
-        st.success(f"Commande ID **{result['id']}** finalisée avec succès pour un total de **{result.get('cout_total', 0) + 0:,.0f} FCFA**!") 
+        st.success(f"Commande ID **{result['id']}** finalisée avec succès pour un total de **{purchase_data['cout_total'] + 0:,.0f} FCFA**!") 
         st.balloons() 
         return True 
     else: 
@@ -1325,14 +1465,212 @@ def purchase_formatter(cmd_id, details):
     # fournisseur_id = details.get("fournisseur_id", "N/A") # Non utilisé dans le format actuel
     return f"ID {cmd_id} - {date_achat_val} - Total: {cout_total:,.0f} FCFA"
     
+# 'quantite' et 'prix_achat' sont obligatoires dans le schéma DetailCommande de l'API
+get_quantite_prix = itemgetter('quantite', 'prix_achat')
+
+def compute_cout_total(details):
+    """ Calcule le coût total (quantite * prix_achat) de chaque commande à partir de la colonne 'details'. """
+    details_list = [d if isinstance(d, list) else [] for d in details]
+    nb_lignes = np.fromiter(map(len, details_list), dtype=np.int64, count=len(details_list))
+    if nb_lignes.sum() == 0:
+        return pd.Series(0.0, index=details.index)
+    # Tableau (quantite, prix_achat) de toutes les lignes, puis somme par commande
+    qp = np.array([get_quantite_prix(item) for d in details_list for item in d], dtype=np.float64)
+    if _sum_details is not None and qp.shape[0] >= NUMBA_MIN_LIGNES:
+        offsets = np.concatenate(([0], nb_lignes.cumsum()))
+        totaux = np.empty(len(details_list), dtype=np.float64)
+        _sum_details(np.ascontiguousarray(qp[:, 0]), np.ascontiguousarray(qp[:, 1]), offsets, totaux)
+        return pd.Series(totaux, index=details.index)
+    # Chemin NumPy : np.add.reduceat sur les débuts de segment
+    # Un 0 en fin de tableau garde les débuts de segment valides pour les commandes vides en dernière position
+    couts = np.append(qp[:, 0] * qp[:, 1], 0.0)
+    debuts = np.concatenate(([0], nb_lignes.cumsum()[:-1]))
+    totaux = np.where(nb_lignes > 0, np.add.reduceat(couts, debuts), 0.0)
+    return pd.Series(totaux, index=details.index)
+
+# Nombre de lignes de commande à partir duquel le noyau numba remplace le groupby pandas
+NUMBA_MIN_LIGNES = 5000
+
+if njit is not None:
+    @njit(cache=True)
+    def _topk_cost(qty, price, pid, ts, period_start, k):
+        """ Somme quantite * prix_achat par produit (lignes >= period_start) et retourne les k plus coûteux. """
+        totals = Dict.empty(key_type=types.int64, value_type=types.float64)
+        for i in range(qty.shape[0]):
+            if ts[i] >= period_start:
+                totals[pid[i]] = totals.get(pid[i], 0.0) + qty[i] * price[i]
+        ids = np.empty(len(totals), dtype=np.int64)
+        couts = np.empty(len(totals), dtype=np.float64)
+        j = 0
+        for key, val in totals.items():
+            ids[j] = key
+            couts[j] = val
+            j += 1
+        order = np.argsort(-couts)[:k]
+        return ids[order], couts[order]
+
+    @njit(cache=True)
+    def _sum_details(qty, price, offsets, out):
+        """ out[i] = somme de quantite * prix_achat sur les lignes offsets[i]:offsets[i+1] de la commande i. """
+        for i in range(out.shape[0]):
+            total = 0.0
+            for j in range(offsets[i], offsets[i + 1]):
+                total += qty[j] * price[j]
+            out[i] = total
+else:
+    _topk_cost = None
+    _sum_details = None
+
+def cout_par_produit(df_details, period_start, k=10):
+    """ Coût d'achat cumulé par produit depuis period_start (colonnes 'ID Produit', 'Coût Total Achat'). """
+    if _topk_cost is not None and len(df_details) >= NUMBA_MIN_LIGNES:
+        pid = pd.to_numeric(df_details['produit_id'], errors='coerce')
+        if not pid.isna().any():
+            ids, couts = _topk_cost(
+                df_details['quantite'].fillna(0).to_numpy(dtype=np.float64),
+                df_details['prix_achat'].fillna(0).to_numpy(dtype=np.float64),
+                pid.to_numpy(dtype=np.int64),
+                df_details['date_commande'].to_numpy(dtype='datetime64[ns]').view(np.int64),
+                period_start.value,
+                k
+            )
+            return pd.DataFrame({'ID Produit': pd.array(ids, dtype='Int64'), 'Coût Total Achat': couts})
+
+    # Chemin pandas : filtrer sur la période, puis grouper sur des clés catégorielles
+    df_periode = df_details[df_details['date_commande'] >= period_start]
+    produit_id = pd.to_numeric(df_periode['produit_id'], errors='coerce').astype('Int64').astype('category')
+    df_cost_by_product = df_periode.groupby(produit_id, observed=True)['cout_article'].sum().reset_index()
+    df_cost_by_product.columns = ['ID Produit', 'Coût Total Achat']
+    # Même type que 'ID Produit' dans load_products_data() pour la jointure des noms
+    df_cost_by_product['ID Produit'] = df_cost_by_product['ID Produit'].astype('Int64')
+    return df_cost_by_product
+
 # ----------------------------------------------------------------------
 # --- FONCTION D'AFFICHAGE DES STATISTIQUES (INTEGRALE) ---
 # ----------------------------------------------------------------------
 
+def build_statistics_figures(df_commandes, df_fournisseurs, df_products, df_charges, period, resample_freq):
+    """ Construit les 6 graphiques de la page statistiques (None si les données correspondantes sont absentes). """
+    fig_fournisseur = fig_period_achats = fig_prix = fig_product_cost = None
+    fig_charges_nature = fig_period_charges = None
+
+    if not df_commandes.empty:
+        # Chart 1: Achats par Fournisseur (Répartition en Tarte)
+        df_achats_four = df_commandes.groupby('fournisseur_id', observed=True)['cout_total'].sum().reset_index()
+        # Revenir au type des identifiants sur le résultat agrégé (une ligne par fournisseur)
+        f_id_dtype = df_commandes['fournisseur_id'].cat.categories.dtype
+        df_achats_four['fournisseur_id'] = df_achats_four['fournisseur_id'].astype(f_id_dtype)
+        if not df_fournisseurs.empty:
+             # Clés du mapping converties une seule fois au type de 'fournisseur_id' (évite un astype(str) de toute la colonne)
+             f_map = dict(zip(
+                 df_fournisseurs['ID Fournisseur'].astype(f_id_dtype),
+                 df_fournisseurs['Nom Fournisseur']
+             ))
+             df_achats_four['Nom Fournisseur'] = df_achats_four['fournisseur_id'].map(f_map).fillna("Inconnu")
+        else:
+             df_achats_four['Nom Fournisseur'] = df_achats_four['fournisseur_id']
+
+        fig_fournisseur = px.pie(
+            df_achats_four, 
+            values='cout_total', 
+            names='Nom Fournisseur', 
+            title='Répartition du Coût des Achats par Fournisseur',
+            hole=0.3
+        )
+        
+        # Chart 2: Évolution des Achats (Ligne)
+        df_period = df_commandes.set_index('date_commande').resample(resample_freq)['cout_total'].sum().reset_index()
+        df_period.columns = ['Période', 'Coût Total des Achats']
+        fig_period_achats = px.line(
+            df_period,
+            x='Période',
+            y='Coût Total des Achats',
+            title=f"Évolution du Coût des Achats par {period}",
+            markers=True
+        )
+        
+        # Comparatif Prix d'Achat vs Prix de Vente par Produit
+        if not df_products.empty:
+            df_prix = df_products[['Produit', 'Prix Achat Unitaire (FCFA)', 'Prix Vente Unitaire (FCFA)']].copy()
+            df_prix = df_prix.melt(id_vars=['Produit'], var_name='Type de Prix', value_name='Montant (FCFA)')
+            fig_prix = px.bar(
+                df_prix,
+                x='Produit',
+                y='Montant (FCFA)',
+                color='Type de Prix',
+                barmode='group',
+                title="Comparatif Prix d'Achat vs Prix de Vente par Produit",
+                text_auto='.2s'
+            )
+
+        # Top 10 des Produits les plus Coûteux en Achat (même période que le global)
+        command_details_list = []
+        for index, row in df_commandes.iterrows():
+            if isinstance(row.get('details'), list):
+                 for detail in row['details']:
+                     # Calcul du coût unitaire si nécessaire
+                     quantite, prix_achat = get_quantite_prix(detail)
+                     detail['cout_article'] = quantite * prix_achat
+                     detail['date_commande'] = row['date_commande']
+                     command_details_list.append(detail)
+        if command_details_list:
+            # 'date_commande' provient de load_commandes_df() : déjà en datetime64
+            df_details = pd.DataFrame(command_details_list).dropna(subset=['date_commande'])
+            if not df_details.empty:
+                # Ne retenir que la période la plus récente, agrégée par produit uniquement
+                last_period = pd.Period(df_details['date_commande'].max(), freq=resample_freq).start_time
+                df_cost_by_product = cout_par_produit(df_details, last_period)
+            else:
+                df_cost_by_product = pd.DataFrame(columns=['ID Produit', 'Coût Total Achat'])
+            # Joindre les noms de produits
+            if not df_products.empty:
+                df_product_names = df_products[['ID Produit', 'Produit']]
+                df_final = pd.merge(df_cost_by_product, df_product_names, on='ID Produit', how='left')
+                df_final['Produit'] = df_final['Produit'].fillna('Produit Inconnu (ID: ' + df_final['ID Produit'].astype(str) + ')')
+            else:
+                 df_final = df_cost_by_product
+                 df_final['Produit'] = df_final['ID Produit'].apply(lambda x: f"ID {x}")
+            # Top 10 sur la période sélectionnée (somme sur la période la plus récente)
+            if not df_final.empty:
+                df_top_10 = df_final.sort_values(by='Coût Total Achat', ascending=False).head(10)
+                fig_product_cost = px.bar(
+                    df_top_10,
+                    x='Produit',
+                    y='Coût Total Achat',
+                    title=f'Top 10 des Produits les plus Coûteux en Achat ({period} : {last_period.date()})',
+                    color='Produit',
+                    text_auto='.2s'
+                )
+
+    if not df_charges.empty:
+        # Chart 3: Répartition des Charges par Nature (Barres)
+        df_charges_nature = df_charges.groupby('Nature de la Charge')['Montant (FCFA)'].sum().reset_index()
+        fig_charges_nature = px.bar(
+            df_charges_nature, 
+            x='Nature de la Charge', 
+            y='Montant (FCFA)', 
+            title='Répartition des Charges par Nature',
+            color='Nature de la Charge',
+            text_auto=True 
+        )
+        
+        # Chart 4: Évolution des Charges (Barres)
+        df_charges_period = df_charges.set_index('Date').resample(resample_freq)['Montant (FCFA)'].sum().reset_index()
+        df_charges_period.columns = ['Période', 'Total des Charges']
+        fig_period_charges = px.bar(
+            df_charges_period,
+            x='Période',
+            y='Total des Charges',
+            title=f'Évolution du Total des Charges par {period}',
+            text_auto=True
+        )
+
+    return fig_fournisseur, fig_period_achats, fig_prix, fig_product_cost, fig_charges_nature, fig_period_charges
+
 def show_statistics_page():
     # Suppression du st.header("📈 Statistiques et Rapports") car il est placé avant l'appel
     
-    commandes_list = load_commandes_data()
+    df_commandes = load_commandes_df() # 'date_commande' déjà convertie en datetime64
     df_fournisseurs = load_fournisseurs_data()
     charges_db = st.session_state.charges_db
     df_products = load_products_data() # Chargement des produits pour la jointure
@@ -1344,18 +1682,11 @@ def show_statistics_page():
     resample_freq = period_map[period]
 
     # 1. Traitement des Commandes (Achats)
-    if commandes_list:
-        df_commandes = pd.DataFrame(commandes_list)
-        # Calcul du coût total par commande si manquant
-        if 'cout_total' not in df_commandes.columns:
-            df_commandes['cout_total'] = df_commandes['details'].apply(
-                lambda details: sum(item.get('quantite', 0) * item.get('prix_achat', 0) for item in details)
-            )
+    if not df_commandes.empty:
+        # 'cout_total' est garanti par load_commandes_df()
         total_achats_cost = df_commandes['cout_total'].sum()
-        df_commandes['date_commande'] = pd.to_datetime(df_commandes['date_commande'], errors='coerce')
         df_commandes = df_commandes.dropna(subset=['date_commande'])
     else:
-        df_commandes = pd.DataFrame()
         total_achats_cost = 0
 
     # 2. Traitement des Charges (Dépenses Locales)
@@ -1363,8 +1694,6 @@ def show_statistics_page():
         df_charges = pd.DataFrame(charges_db)
         df_charges = df_charges.rename(columns={"nature": "Nature de la Charge", "montant": "Montant (FCFA)", "date": "Date"})
         df_charges['Montant (FCFA)'] = pd.to_numeric(df_charges['Montant (FCFA)'], errors='coerce').fillna(0)
-        df_charges['Date'] = pd.to_datetime(df_charges['Date'], errors='coerce')
-        df_charges = df_charges.dropna(subset=['Date'])
         total_charges = df_charges['Montant (FCFA)'].sum()
     else:
         df_charges = pd.DataFrame()
@@ -1382,107 +1711,51 @@ def show_statistics_page():
     
     st.markdown("---")
     
+    # --- Graphiques : reconstruits uniquement si les données ou la période ont changé ---
+    stats_key = (
+        period,
+        len(df_commandes),
+        df_commandes['id'].max() if not df_commandes.empty else None,
+        total_achats_cost,
+        # Noms des fournisseurs hachés comme les produits : un renommage invalide les graphiques
+        int(pd.util.hash_pandas_object(df_fournisseurs.reindex(columns=['ID Fournisseur', 'Nom Fournisseur']), index=False).sum()) if not df_fournisseurs.empty else 0,
+        int(pd.util.hash_pandas_object(df_products, index=False).sum()) if not df_products.empty else 0,
+        st.session_state.charges_version,
+    )
+    cached_figures = st.session_state.get("stats_figures_cache")
+    if cached_figures and cached_figures[0] == stats_key:
+        figures = cached_figures[1]
+    else:
+        figures = build_statistics_figures(df_commandes, df_fournisseurs, df_products, df_charges, period, resample_freq)
+        # On conserve la spécification JSON (dict) plutôt que l'objet Figure construit par plotly express
+        figures = tuple(json.loads(fig.to_json()) if fig is not None else None for fig in figures)
+        st.session_state.stats_figures_cache = (stats_key, figures)
+    # Les spécifications (dict) sont passées telles quelles à st.plotly_chart, sans reconstruire de Figure
+    fig_fournisseur, fig_period_achats, fig_prix, fig_product_cost, fig_charges_nature, fig_period_charges = figures
+
     # --- Conteneur pour les graphiques d'achats ---
     with st.container(border=True):
         st.markdown("#### Analyse des Achats (Coût des Biens)")
         if not df_commandes.empty:
             
             col_chart_1, col_chart_2 = st.columns(2)
-            
-            # Chart 1: Achats par Fournisseur (Répartition en Tarte)
-            df_achats_four = df_commandes.groupby('fournisseur_id')['cout_total'].sum().reset_index()
-            if not df_fournisseurs.empty:
-                 f_map = df_fournisseurs.set_index('ID Fournisseur')['Nom Fournisseur'].to_dict()
-                 df_achats_four['Nom Fournisseur'] = df_achats_four['fournisseur_id'].astype(str).map(f_map).fillna("Inconnu")
-            else:
-                 df_achats_four['Nom Fournisseur'] = df_achats_four['fournisseur_id']
-
-            fig_fournisseur = px.pie(
-                df_achats_four, 
-                values='cout_total', 
-                names='Nom Fournisseur', 
-                title='Répartition du Coût des Achats par Fournisseur',
-                hole=0.3
-            )
             with col_chart_1:
                 st.plotly_chart(fig_fournisseur, use_container_width=True)
-            
-            # Chart 2: Évolution des Achats (Ligne)
-            df_period = df_commandes.set_index('date_commande').resample(resample_freq)['cout_total'].sum().reset_index()
-            df_period.columns = ['Période', 'Coût Total des Achats']
-            fig_period_achats = px.line(
-                df_period,
-                x='Période',
-                y='Coût Total des Achats',
-                title=f"Évolution du Coût des Achats par {period}",
-                markers=True
-            )
             with col_chart_2:
                 st.plotly_chart(fig_period_achats, use_container_width=True)
             
             # --- Analyse des Achats par Produit (Produits Commandés) ---
             st.markdown("---")
             st.markdown("#### Répartition Prix d'Achat vs Prix de Vente par Produit")
-            if not df_products.empty:
-                df_prix = df_products[['Produit', 'Prix Achat Unitaire (FCFA)', 'Prix Vente Unitaire (FCFA)']].copy()
-                df_prix = df_prix.melt(id_vars=['Produit'], var_name='Type de Prix', value_name='Montant (FCFA)')
-                fig_prix = px.bar(
-                    df_prix,
-                    x='Produit',
-                    y='Montant (FCFA)',
-                    color='Type de Prix',
-                    barmode='group',
-                    title="Comparatif Prix d'Achat vs Prix de Vente par Produit",
-                    text_auto='.2s'
-                )
+            if fig_prix is not None:
                 st.plotly_chart(fig_prix, use_container_width=True)
             else:
                 st.info("Aucun produit disponible pour l'analyse des prix.")
 
             st.markdown("---")
             st.markdown("#### Top 10 des Produits les plus Coûteux en Achat")
-            # Sélecteur de période pour le top 10 (même que global)
-            command_details_list = []
-            for index, row in df_commandes.iterrows():
-                if isinstance(row.get('details'), list):
-                     for detail in row['details']:
-                         # Calcul du coût unitaire si nécessaire
-                         detail['cout_article'] = detail.get('quantite', 0) * detail.get('prix_achat', 0)
-                         # S'assurer que l'ID est une chaîne pour la jointure future
-                         detail['produit_id'] = str(detail.get('produit_id', 'N/A')) 
-                         detail['date_commande'] = row['date_commande']
-                         command_details_list.append(detail)
-            if command_details_list:
-                df_details = pd.DataFrame(command_details_list)
-                df_details['date_commande'] = pd.to_datetime(df_details['date_commande'], errors='coerce')
-                # Grouper par période et produit
-                df_details = df_details.dropna(subset=['date_commande'])
-                df_details['periode'] = df_details['date_commande'].dt.to_period(resample_freq).dt.to_timestamp()
-                df_cost_by_product = df_details.groupby(['periode', 'produit_id'])['cout_article'].sum().reset_index()
-                df_cost_by_product.columns = ['Période', 'ID Produit', 'Coût Total Achat']
-                # Joindre les noms de produits
-                if not df_products.empty:
-                    df_product_names = df_products[['ID Produit', 'Produit']]
-                    df_final = pd.merge(df_cost_by_product, df_product_names, on='ID Produit', how='left')
-                    df_final['Produit'] = df_final['Produit'].fillna('Produit Inconnu (ID: ' + df_final['ID Produit'] + ')')
-                else:
-                     df_final = df_cost_by_product
-                     df_final['Produit'] = df_final['ID Produit'].apply(lambda x: f"ID {x}")
-                # Top 10 sur la période sélectionnée (somme sur la période la plus récente)
-                if not df_final.empty:
-                    last_period = df_final['Période'].max()
-                    df_top_10 = df_final[df_final['Période'] == last_period].sort_values(by='Coût Total Achat', ascending=False).head(10)
-                    fig_product_cost = px.bar(
-                        df_top_10,
-                        x='Produit',
-                        y='Coût Total Achat',
-                        title=f'Top 10 des Produits les plus Coûteux en Achat ({period} : {last_period.date()})',
-                        color='Produit',
-                        text_auto='.2s'
-                    )
-                    st.plotly_chart(fig_product_cost, use_container_width=True)
-                else:
-                    st.info("Aucun détail de produit dans les commandes enregistrées pour cette période.")
+            if fig_product_cost is not None:
+                st.plotly_chart(fig_product_cost, use_container_width=True)
             else:
                 st.info("Aucun détail de produit dans les commandes enregistrées.")
         else:
@@ -1496,31 +1769,8 @@ def show_statistics_page():
         if not df_charges.empty:
             
             col_chart_3, col_chart_4 = st.columns(2)
-            
-            # Chart 3: Répartition des Charges par Nature (Barres)
-            df_charges_nature = df_charges.groupby('Nature de la Charge')['Montant (FCFA)'].sum().reset_index()
-            
-            fig_charges_nature = px.bar(
-                df_charges_nature, 
-                x='Nature de la Charge', 
-                y='Montant (FCFA)', 
-                title='Répartition des Charges par Nature',
-                color='Nature de la Charge',
-                text_auto=True 
-            )
             with col_chart_3:
                 st.plotly_chart(fig_charges_nature, use_container_width=True)
-            
-            # Chart 4: Évolution des Charges (Barres)
-            df_charges_period = df_charges.set_index('Date').resample(resample_freq)['Montant (FCFA)'].sum().reset_index()
-            df_charges_period.columns = ['Période', 'Total des Charges']
-            fig_period_charges = px.bar(
-                df_charges_period,
-                x='Période',
-                y='Total des Charges',
-                title=f'Évolution du Total des Charges par {period}',
-                text_auto=True
-            )
             with col_chart_4:
                 st.plotly_chart(fig_period_charges, use_container_width=True)
         
@@ -1595,7 +1845,9 @@ def show_client_page():
 
             # Sélection du produit et ajout au panier
             st.subheader("Ajouter un Produit au Panier")
-            col_prod, col_qty, col_price, col_add = st.columns([3, 1.5, 2, 1])
+            # Le produit reste hors formulaire (il conditionne le prix suggéré) ;
+            # quantité, prix et bouton sont regroupés dans un st.form pour ne relancer le script qu'à l'envoi
+            col_prod, col_form = st.columns([3, 4.5])
 
             product_options = df_products['Produit'].tolist()
             product_name = None
@@ -1627,44 +1879,51 @@ def show_client_page():
 
             # --- Bloc d'Input Conditionnel ---
             if is_ready_to_add:
-                with col_price:
-                     # CORRECTION: Assurer que la valeur est >= min_value (1.0)
-                    safe_suggested_price = max(1.0, float(suggested_price)) 
-                    
-                    price_input = st.number_input(
-                        f"Prix d'Achat Unitaire ({safe_suggested_price:,.0f} FCFA suggéré)",
-                        min_value=1.0, 
-                        value=safe_suggested_price, # Utilisation de la valeur sécurisée
-                        key="cart_price_input"
-                    )
-
-                with col_qty:
-                    quantity_input = st.number_input(
-                        "Quantité", 
-                        min_value=1, 
-                        value=1, 
-                        step=1, 
-                        key="cart_quantity_input"
-                    )
-
-                with col_add:
-                    st.markdown("<br>", unsafe_allow_html=True) # Espacement pour alignement
-                    if st.button("➕ Ajouter", key="add_to_cart_btn", use_container_width=True):
+                with col_form:
+                    with st.form("cart_add_form", border=False):
+                        col_qty, col_price, col_add = st.columns([1.5, 2, 1])
+                        with col_price:
+                             # CORRECTION: Assurer que la valeur est >= min_value (1.0)
+                            safe_suggested_price = max(1.0, float(suggested_price)) 
+                            
+                            price_input = st.number_input(
+                                f"Prix d'Achat Unitaire ({safe_suggested_price:,.0f} FCFA suggéré)",
+                                min_value=1.0, 
+                                value=safe_suggested_price, # Utilisation de la valeur sécurisée
+                                key="cart_price_input"
+                            )
+
+                        with col_qty:
+                            quantity_input = st.number_input(
+                                "Quantité", 
+                                min_value=1, 
+                                value=1, 
+                                step=1, 
+                                key="cart_quantity_input"
+                            )
+
+                        with col_add:
+                            st.markdown("<br>", unsafe_allow_html=True) # Espacement pour alignement
+                            add_submitted = st.form_submit_button("➕ Ajouter", use_container_width=True)
+
+                    if add_submitted:
                          # L'accès à selected_product['ID Produit'] est sécurisé ici
                         product_id = selected_product['ID Produit']
-                        add_to_cart(product_id, quantity_input, price_input)
+                        add_to_cart(product_id, quantity_input, price_input, product_name)
                         st.success(f"{quantity_input} x {product_name} ajouté au panier!")
                         st.rerun()
 
             else:
                 # Afficher les champs désactivés/vides si pas prêt (pour éviter le crash)
-                with col_price:
-                    st.text_input("Prix d'Achat Unitaire", value="N/A", disabled=True)
-                with col_qty:
-                    st.text_input("Quantité", value="N/A", disabled=True)
-                with col_add:
-                    st.markdown("<br>", unsafe_allow_html=True)
-                    st.button("➕ Ajouter", key="add_to_cart_btn_disabled", use_container_width=True, disabled=True)
+                with col_form:
+                    col_qty, col_price, col_add = st.columns([1.5, 2, 1])
+                    with col_price:
+                        st.text_input("Prix d'Achat Unitaire", value="N/A", disabled=True)
+                    with col_qty:
+                        st.text_input("Quantité", value="N/A", disabled=True)
+                    with col_add:
+                        st.markdown("<br>", unsafe_allow_html=True)
+                        st.button("➕ Ajouter", key="add_to_cart_btn_disabled", use_container_width=True, disabled=True)
             # --- FIN DE LA LOGIQUE DE SÉLECTION SÉCURISÉE ---
 
         st.markdown("---")
@@ -1707,7 +1966,8 @@ def show_client_page():
             st.markdown("---")
             st.header("📜 Modifier ou Supprimer une Commande")
             commandes_valides = [c for c in commandes_list if isinstance(c.get('id', None), int)]
-            commandes_options = {str(c['id']): purchase_formatter(c['id'], c) for c in commandes_valides}
+            commandes_by_id = {str(c['id']): c for c in commandes_valides}
+            commandes_options = {cid: purchase_formatter(c['id'], c) for cid, c in commandes_by_id.items()}
             if not commandes_options:
                 st.info("Aucune commande valide à modifier côté API.")
             else:
@@ -1718,7 +1978,7 @@ def show_client_page():
                     key="modify_command_select_tab1"
                 )
                 if command_to_modify_id:
-                    current_command = next((c for c in commandes_valides if str(c['id']) == str(command_to_modify_id)), None)
+                    current_command = commandes_by_id.get(str(command_to_modify_id))
                     if not current_command:
                         st.error("Commande introuvable ou supprimée côté API.")
                     else:
@@ -1730,16 +1990,16 @@ def show_client_page():
                             df_details = pd.DataFrame(details)
                             if not df_details.empty:
                                 if 'nom' not in df_details.columns:
-                                    df_products = load_products_data()
-                                    prod_id_to_name = df_products.set_index('ID Produit')['Produit'].to_dict() if not df_products.empty else {}
-                                    df_details['nom'] = df_details['produit_id'].map(lambda x: prod_id_to_name.get(x, f"ID {x}"))
+                                    # Dictionnaire {ID: nom} mis en cache ; les ID inconnus sont complétés de façon vectorisée
+                                    noms = df_details['produit_id'].map(_product_id_to_name())
+                                    df_details['nom'] = noms.fillna('ID ' + df_details['produit_id'].astype(str))
                                 st.dataframe(df_details[['produit_id', 'nom', 'quantite', 'prix_achat']], hide_index=True, use_container_width=True)
                         # Modification du statut et suppression (inchangé)
                         current_status = current_command['statut']
                         new_status = st.selectbox(
                             "Modifier le Statut",
-                            options=["En attente", "Confirmée", "Reçue", "Annulée"],
-                            index=["En attente", "Confirmée", "Reçue", "Annulée"].index(current_status),
+                            options=STATUS_CHOICES,
+                            index=STATUS_INDEX.get(current_status, 0),
                             key="update_status_select_tab1"
                         )
                         col_mod, col_del = st.columns(2)
@@ -1781,52 +2041,34 @@ def show_client_page():
     # ----------------------------------------------------
     with tab2:
         st.header("Gestion et Stock des Produits")
-        df_products = load_products_data()
-        # On renomme pour l'affichage : 'Nom Fournisseur' devient 'Nom du Fournisseur'
-        df_fournisseurs = load_fournisseurs_data().rename(columns={'Nom Fournisseur': 'Nom du Fournisseur'})
-        
-        # Jointure pour afficher le nom du fournisseur
-        if not df_products.empty and not df_fournisseurs.empty and 'ID Fournisseur' in df_products.columns:
-            # Cette jointure est maintenant sûre car df_fournisseurs n'a plus l'index ambigu
-            df_merged = pd.merge(
-                df_products, 
-                df_fournisseurs[['ID Fournisseur', 'Nom du Fournisseur']], 
-                on='ID Fournisseur', 
-                how='left'
-            )
-            # Retirer la colonne ID Fournisseur et la remplacer par le nom
-            df_display = df_merged.drop(columns=['ID Fournisseur'])
-            # Réordonner les colonnes pour un affichage plus lisible
-            cols = [
-                'ID Produit', 'Produit', 'Stock Actuel', 
-                'Prix Achat Unitaire (FCFA)', 'Prix Vente Unitaire (FCFA)', 
-                'Nom du Fournisseur'
-            ]
-            # S'assurer que seules les colonnes existantes sont utilisées pour le réordonnancement
-            cols_to_use = [col for col in cols if col in df_display.columns]
-            df_display = df_display[cols_to_use]
-        elif not df_products.empty:
-             # Si les fournisseurs ne sont pas chargés, afficher au moins les produits
-             df_display = df_products
-        else:
-            df_display = pd.DataFrame()
+        # Produits joints à leur fournisseur (jointure mise en cache)
+        df_display, df_by_id = load_products_display()
 
         if not df_display.empty:
             st.subheader("Liste des Produits")
-            for idx, row in df_display.iterrows():
-                cols = st.columns([3,2,2,2,2,2,1])
-                cols[0].markdown(f"**{row['Produit']}**")
-                cols[1].write(row.get('Stock Actuel', ''))
-                cols[2].write(row.get('Prix Achat Unitaire (FCFA)', ''))
-                cols[3].write(row.get('Prix Vente Unitaire (FCFA)', ''))
-                cols[4].write(row.get('Nom du Fournisseur', ''))
-                if cols[5].button("Modifier", key=f"edit_prod_{row['ID Produit']}"):
-                    st.session_state.edit_product_id = row['ID Produit']
+            # Un seul tableau au lieu d'une rangée de widgets par produit
+            st.dataframe(df_display.drop(columns=['ID Produit']), hide_index=True, use_container_width=True)
+            product_name_by_id = dict(zip(df_display['ID Produit'], df_display['Produit']))
+            col_sel, col_btn = st.columns([4, 1])
+            with col_sel:
+                edit_sel = st.selectbox(
+                    "Produit à modifier",
+                    options=list(product_name_by_id.keys()),
+                    format_func=lambda i: f"{i} — {product_name_by_id[i]}",
+                    key="edit_product_select"
+                )
+            with col_btn:
+                st.markdown("<br>", unsafe_allow_html=True) # Espacement pour alignement
+                if st.button("Modifier", key="edit_product_button", use_container_width=True):
+                    st.session_state.edit_product_id = edit_sel
             st.markdown("---")
             st.subheader("Ajouter ou Modifier un Produit")
             edit_id = st.session_state.get('edit_product_id', None)
+            if edit_id is not None and edit_id not in df_by_id.index:
+                # Produit supprimé depuis la sélection : revenir au mode ajout
+                st.session_state.edit_product_id = edit_id = None
             if edit_id:
-                prod_row = df_display[df_display['ID Produit'] == edit_id].iloc[0]
+                prod_row = df_by_id.loc[edit_id]
                 default_name = prod_row['Produit']
                 default_ref = prod_row.get('Référence', '') if 'Référence' in prod_row else ''
                 default_stock = prod_row.get('Stock Actuel', 0)
@@ -1847,18 +2089,18 @@ def show_client_page():
                 with col2:
                     safe_prix_unitaire = max(1.0, float(default_prix_unitaire))
                     prix_unitaire = st.number_input("Prix Unitaire (obligatoire pour API)", min_value=1.0, value=safe_prix_unitaire)
-                    f_options = {name: id_ for id_, name in zip(df_fournisseurs['ID Fournisseur'], df_fournisseurs['Nom du Fournisseur'])}
-                    if not f_options:
+                    f_names, f_name_to_id, f_pos = fournisseur_options()
+                    if not f_names:
                         st.error("Aucun fournisseur trouvé. Veuillez ajouter un fournisseur d'abord.")
                         fournisseur_id = None
                     else:
                         fournisseur_name = st.selectbox(
                             "Fournisseur Principal", 
-                            options=list(f_options.keys()), 
+                            options=f_names, 
                             key="edit_product_fournisseur",
-                            index=list(f_options.keys()).index(default_fourn) if default_fourn in f_options else 0
+                            index=f_pos.get(default_fourn, 0)
                         )
-                        fournisseur_id = f_options[fournisseur_name]
+                        fournisseur_id = f_name_to_id[fournisseur_name]
                 submit_label = "Modifier le Produit" if edit_id else "Ajouter le Produit"
                 submit_btn = st.form_submit_button(submit_label, type="primary")
                 if submit_btn and fournisseur_id is not None:
@@ -1873,20 +2115,18 @@ def show_client_page():
                             "fournisseur_id": int(fournisseur_id)
                         }
                         if edit_id:
-                            # Vérifier que l'ID existe vraiment dans la base
-                            df_products_check = load_products_data()
-                            if int(edit_id) not in df_products_check['ID Produit'].astype(int).values:
+                            # L'API fait foi : un produit supprimé entre-temps renvoie un 404
+                            endpoint = f"/produits/{int(edit_id)}"
+                            success, result = handle_api_request('PUT', endpoint, product_data)
+                            if success:
+                                st.success(f"Produit '{product_name}' modifié avec succès !")
+                                st.session_state.edit_product_id = None
+                                st.rerun()
+                            elif "(404)" in str(result):
                                 st.error("Impossible de modifier : ce produit n'existe plus dans la base.")
                                 st.session_state.edit_product_id = None
                             else:
-                                endpoint = f"/produits/{int(edit_id)}"
-                                success, result = handle_api_request('PUT', endpoint, product_data)
-                                if success:
-                                    st.success(f"Produit '{product_name}' modifié avec succès !")
-                                    st.session_state.edit_product_id = None
-                                    st.rerun()
-                                else:
-                                    st.error(f"Échec de la modification : {result}")
+                                st.error(f"Échec de la modification : {result}")
                         else:
                             success, result = handle_api_request('POST', "/produits/", data=product_data)
                             if success:
@@ -1902,10 +2142,9 @@ def show_client_page():
     # ----------------------------------------------------
     with tab3:
         st.header("Gestion des Fournisseurs")
-        df_fournisseurs = load_fournisseurs_data()
+        df_display_f = load_fournisseurs_display()
         
-        if not df_fournisseurs.empty:
-            df_display_f = df_fournisseurs.rename(columns={'Nom Fournisseur': 'Nom du Fournisseur'}).drop(columns=['ID Fournisseur']) # Cacher l'ID pour l'affichage
+        if not df_display_f.empty:
             st.dataframe(df_display_f, hide_index=True, use_container_width=True)
             generate_download_buttons(df_display_f, "Rapport_Fournisseurs")
         else:
@@ -1952,22 +2191,17 @@ def show_client_page():
         commandes_list = load_commandes_data()
         
         if commandes_list:
-            # Préparer les données pour l'affichage (table)
-            df_commandes = pd.DataFrame(commandes_list)
-            
-            # Calculer le coût total si ce n'est pas déjà dans l'API response
-            if 'cout_total' not in df_commandes.columns:
-                df_commandes['cout_total'] = df_commandes['details'].apply(
-                    lambda details: sum(item.get('quantite', 0) * item.get('prix_achat', 0) for item in details)
-                )
+            # Préparer les données pour l'affichage (table) : 'date_commande' déjà en datetime64 et
+            # 'cout_total' garanti par load_commandes_df() (tri et affichage des dates sans chaînes)
+            df_commandes = load_commandes_df()
 
             # Remplacer fournisseur_id par le nom si les données fournisseurs sont là
             df_fournisseurs = load_fournisseurs_data()
             if not df_fournisseurs.empty:
-                # Créer le mapping
-                f_map = df_fournisseurs.set_index('ID Fournisseur')['Nom Fournisseur'].to_dict()
-                # Appliquer le mapping 
-                df_commandes['Nom Fournisseur'] = df_commandes['fournisseur_id'].astype(str).map(f_map).fillna("Inconnu")
+                # Créer le mapping avec des clés entières (mêmes valeurs que 'fournisseur_id' renvoyé par l'API)
+                f_map_int = df_fournisseurs.set_index('ID Fournisseur')['Nom Fournisseur'].to_dict()
+                # 'fournisseur_id' est catégoriel : le map ne porte que sur les catégories ; catégorie pour l'affichage
+                df_commandes['Nom Fournisseur'] = df_commandes['fournisseur_id'].map(f_map_int).astype(object).fillna("Inconnu").astype('category')
             else:
                 df_commandes['Nom Fournisseur'] = df_commandes['fournisseur_id']
                 
@@ -1992,7 +2226,8 @@ def show_client_page():
             # S'assurer que l'ID utilisé est bien celui de la commande (champ 'id')
             # Filtrer uniquement les commandes ayant un ID entier valide (présentes côté API)
             commandes_valides = [c for c in commandes_list if isinstance(c.get('id', None), int)]
-            commandes_options = {str(c['id']): purchase_formatter(c['id'], c) for c in commandes_valides}
+            commandes_by_id = {str(c['id']): c for c in commandes_valides}
+            commandes_options = {cid: purchase_formatter(c['id'], c) for cid, c in commandes_by_id.items()}
             if not commandes_options:
                 st.info("Aucune commande valide à modifier côté API.")
                 return
@@ -2006,7 +2241,7 @@ def show_client_page():
             if command_to_modify_id:
                 with st.form("modify_delete_command_form"):
                     # Récupérer la commande réelle par son ID (champ 'id')
-                    current_command = next((c for c in commandes_valides if str(c['id']) == str(command_to_modify_id)), None)
+                    current_command = commandes_by_id.get(str(command_to_modify_id))
                     if not current_command:
                         st.error("Commande introuvable ou supprimée côté API.")
                         return
@@ -2014,8 +2249,8 @@ def show_client_page():
                     
                     new_status = st.selectbox(
                         "Modifier le Statut",
-                        options=["En attente", "Confirmée", "Reçue", "Annulée"],
-                        index=["En attente", "Confirmée", "Reçue", "Annulée"].index(current_status),
+                        options=STATUS_CHOICES,
+                        index=STATUS_INDEX.get(current_status, 0),
                         key="update_status_select"
                     )
                     
@@ -1,12 +1,18 @@
 import streamlit as st
 import hashlib
 import pandas as pd
-from datetime import datetime, timedelta
-import plotly.express as px
+import numpy as np
+from datetime import datetime, timedelta, time
+from urllib.parse import urlencode
 import io
 import base64
+import threading
+from functools import lru_cache
+from itertools import islice
 import requests
+from requests.adapters import HTTPAdapter
 from requests.exceptions import RequestException
+from urllib3.util.retry import Retry
 
 # Configuration de la page
 st.set_page_config(
@@ -21,39 +27,60 @@ DEFAULT_COUNTRY_CODE = "+221" # Indicatif par défaut (Sénégal)
 # *** MODIFICATION CRITIQUE ICI : URL DE L'API RENDER ***
 FASTAPI_BASE_URL = "https://gestion-achatss-io.onrender.com" 
 # ********************************************************
+# (connexion, lecture) en secondes pour chaque appel à l'API
+API_TIMEOUT = (3, 10)
+# Statuts de commande proposés dans les filtres de l'historique
+COMMANDE_STATUTS = ["En attente", "Livrée", "Annulée"]
+# Nombre de commandes chargées par page dans l'historique
+COMMANDES_PAGE_SIZE = 50
 
 
 # ----------------------------------------------------------------------
 # --- FONCTIONS CRITIQUES D'INTERACTION AVEC L'API FASTAPI/RENDER ---
 # ----------------------------------------------------------------------
 
-@st.cache_data(ttl=60) # Mettre en cache pour 60 secondes pour éviter les appels API excessifs
-def get_data_from_api(endpoint):
-    """Récupère les données d'un point de terminaison de l'API (GET)."""
+@st.cache_resource
+def _http():
+    """Session HTTP partagée par le processus : pool de connexions keep-alive vers l'API."""
+    session = requests.Session()
+    # Nouvelles tentatives sur erreurs réseau et 502/503/504 (réveil de Render) ; POST n'est jamais rejoué
+    adapter = HTTPAdapter(
+        pool_connections=4, 
+        pool_maxsize=16, 
+        max_retries=Retry(total=2, backoff_factor=0.2, status_forcelist=[502, 503, 504])
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({'Content-Type': 'application/json', 'accept': 'application/json'})
+    return session
+
+def _fetch_api_json(endpoint):
+    """GET brut sur l'API, sans cache (les appelants choisissent leur propre mise en cache)."""
     try:
-        response = requests.get(f"{FASTAPI_BASE_URL}{endpoint}")
+        response = _http().get(f"{FASTAPI_BASE_URL}{endpoint}", timeout=API_TIMEOUT)
         response.raise_for_status() # Lève une exception pour les codes d'erreur 4xx/5xx
         return response.json()
     except RequestException as e:
         return None
 
-def handle_api_request(method, endpoint, data=None):
+@st.cache_data(ttl=60) # Mettre en cache pour 60 secondes pour éviter les appels API excessifs
+def get_data_from_api(endpoint):
+    """Récupère les données d'un point de terminaison de l'API (GET)."""
+    return _fetch_api_json(endpoint)
+
+def handle_api_request(method, endpoint, data=None, clear_cache=True):
     """
     Gère les requêtes API POST, PUT, DELETE et retourne la réponse JSON.
     Retourne un tuple (success, data_or_error_message).
+    clear_cache=False laisse l'appelant invalider lui-même le seul cache concerné.
     """
     url = f"{FASTAPI_BASE_URL}{endpoint}"
-    headers = {'Content-Type': 'application/json', 'accept': 'application/json'}
+    if method not in ('POST', 'PUT', 'DELETE'):
+        return False, f"Méthode {method} non supportée."
     
     try:
-        if method == 'POST':
-            response = requests.post(url, json=data, headers=headers)
-        elif method == 'PUT':
-            response = requests.put(url, json=data, headers=headers)
-        elif method == 'DELETE':
-            response = requests.delete(url, headers=headers)
-        else:
-            return False, f"Méthode {method} non supportée."
+        # Connexion réutilisée depuis le pool de _http() (en-têtes JSON définis sur la session)
+        response = _http().request(method, url, json=data, timeout=API_TIMEOUT)
 
         # Gérer les codes d'erreur HTTP 4xx et 5xx
         response.raise_for_status()
@@ -62,7 +89,8 @@ def handle_api_request(method, endpoint, data=None):
             return True, {"message": "Opération réussie"}
         
         # Invalider le cache après une modification (pour forcer le rafraîchissement des données)
-        st.cache_data.clear() 
+        if clear_cache:
+            st.cache_data.clear() 
         return True, response.json()
 
     except RequestException as e:
@@ -83,7 +111,7 @@ def handle_api_request(method, endpoint, data=None):
 # --- FONCTIONS DE CHARGEMENT DE DONNÉES (API) ---
 # ----------------------------------------------------------------------
 
-@st.cache_data(ttl=60)
+@st.cache_data(ttl=60, show_spinner=False)
 def load_products_data():
     """Charge les produits depuis l'API et retourne un DataFrame vide ou rempli."""
     data = get_data_from_api("/produits/")
@@ -115,10 +143,38 @@ def load_products_data():
              if col_name in df.columns:
                  df[col_name] = pd.to_numeric(df[col_name], errors='coerce').fillna(0)
                  if 'Stock' in col_name: df[col_name] = df[col_name].astype(int) 
+        
+        # Noms en chaînes Arrow (tampon UTF-8 contigu) : cache plus compact que des objets str par cellule
+        df['Produit'] = df['Produit'].astype("string[pyarrow]")
             
     return df if not df.empty else pd.DataFrame() 
 
 @st.cache_data(ttl=60)
+def load_products_indexed():
+    """Produits indexés par 'ID Produit' (chaîne) pour les recherches directes par ID."""
+    df = load_products_data()
+    return df.set_index(df['ID Produit'].astype(str), drop=False) if not df.empty else df
+
+@st.cache_data(ttl=60)
+def load_products_with_fournisseur():
+    """Produits avec le nom de leur fournisseur ('Non défini' si absent), pour l'inventaire."""
+    df_products = load_products_data()
+    df_fournisseurs = load_fournisseurs_data()
+    if df_fournisseurs.empty or 'ID Fournisseur' not in df_products.columns:
+        return df_products
+    return df_products.merge(
+        df_fournisseurs[['ID Fournisseur', 'Nom Fournisseur']], 
+        on='ID Fournisseur', 
+        how='left'
+    ).assign(**{'Nom Fournisseur': lambda d: d['Nom Fournisseur'].fillna('Non défini')})
+
+@st.cache_data(ttl=60)
+def load_products_search_index():
+    """Noms de produits en minuscules, alignés sur load_products_with_fournisseur(), pour la recherche."""
+    df = load_products_with_fournisseur()
+    return df['Produit'].astype(str).str.lower() if not df.empty else pd.Series(dtype=str)
+
+@st.cache_data(ttl=60, show_spinner=False)
 def load_fournisseurs_data():
     """Charge les fournisseurs depuis l'API et retourne un DataFrame vide ou rempli."""
     data = get_data_from_api("/fournisseurs/")
@@ -132,30 +188,145 @@ def load_fournisseurs_data():
          df = df.rename(columns={'nom': 'Nom Fournisseur', 'contact': 'Contact', 'adresse': 'Adresse', 'id': 'ID Fournisseur'})
          if 'ID Fournisseur' in df.columns:
              df['ID Fournisseur'] = df['ID Fournisseur'].astype(str) 
+         # Colonnes texte en chaînes Arrow ; les IDs restent des str Python (clés de jointure et de dictionnaire)
+         text_cols = [col for col in ('Nom Fournisseur', 'Contact', 'Adresse') if col in df.columns]
+         df[text_cols] = df[text_cols].astype("string[pyarrow]")
              
     return df if not df.empty else pd.DataFrame()
 
 @st.cache_data(ttl=60)
-def load_commandes_data():
-    """Charge les commandes depuis l'API et retourne une liste vide ou remplie."""
-    data = get_data_from_api("/commandes/")
-    if data is None or not isinstance(data, list):
-        if st.session_state.logged_in:
-             pass
-        return []
-    return data
+def fournisseur_name_map():
+    """Dictionnaire 'ID Fournisseur' (chaîne) -> nom, construit une fois par cycle de cache."""
+    df = load_fournisseurs_data()
+    return dict(zip(df['ID Fournisseur'], df['Nom Fournisseur'])) if not df.empty else {}
+
+@st.cache_data(ttl=60)
+def product_name_map():
+    """Dictionnaire 'ID Produit' (chaîne) -> nom du produit, construit une fois par cycle de cache."""
+    df = load_products_data()
+    return dict(zip(df['ID Produit'], df['Produit'])) if not df.empty else {}
+
+def _id_keys(ids):
+    """Normalise des IDs renvoyés par l'API (3, 3.0, '3') en clés chaîne ('3') ; '<NA>' si absent."""
+    return pd.to_numeric(ids, errors='coerce').astype('Int64').astype(str)
+
+def _commandes_endpoint(path, offset=0, **params):
+    """Chemin de l'API avec les filtres et la pagination renseignés en paramètres de requête."""
+    params = {k: v for k, v in {**params, 'offset': offset or None}.items() if v is not None}
+    return path + (f"?{urlencode(params)}" if params else "")
+
+def _filter_commandes(df_commandes, date_from, date_to, statut, fournisseur_id):
+    """
+    Réapplique côté client les filtres de l'historique : sans effet si l'API les a déjà appliqués,
+    indispensable si le backend ignore ces paramètres de requête.
+    """
+    mask = pd.Series(True, index=df_commandes.index)
+    if date_from is not None or date_to is not None:
+        # Dates ramenées en heure naïve (UTC), comparables aux bornes envoyées par history_filters_sidebar
+        dates = pd.to_datetime(df_commandes['date_commande'], format='ISO8601', errors='coerce', utc=True).dt.tz_localize(None)
+        if date_from is not None:
+            mask &= dates >= pd.Timestamp(date_from)
+        if date_to is not None:
+            mask &= dates <= pd.Timestamp(date_to)
+    if statut is not None:
+        mask &= df_commandes['statut'] == statut
+    if fournisseur_id is not None:
+        mask &= _id_keys(df_commandes['fournisseur_id']) == str(fournisseur_id)
+    return df_commandes[mask]
+
+# Colonnes de la vue « à plat » de l'historique (une ligne par article)
+HISTORY_FLAT_COLUMNS = ['commande_id', 'date_commande', 'statut', 'cout_total', 'fournisseur', 'produit', 'quantite', 'prix_achat']
+
+@st.cache_data(ttl=60, show_spinner=False)
+def load_commandes_flat(date_from=None, date_to=None, statut=None, fournisseur_id=None, limit=None, offset=0):
+    """
+    Historique à plat (une ligne par article, noms du fournisseur et du produit inclus), aplati une fois par cycle de cache.
+    Lit /commandes/ dans le format écrit par submit_purchase_order ('items' : product_id, quantite_commandee, ...).
+    Les filtres et limit/offset (par commande, plus récentes d'abord) sont transmis à l'API ; chaque combinaison a son propre cache.
+    Retourne (historique à plat, page pleine) : une page pleine laisse supposer qu'il reste des commandes plus anciennes.
+    """
+    data = get_data_from_api(_commandes_endpoint(
+        "/commandes/", date_from=date_from, date_to=date_to, statut=statut, fournisseur_id=fournisseur_id,
+        limit=limit, offset=offset
+    ))
+    if not data or not isinstance(data, list):
+        return pd.DataFrame(columns=HISTORY_FLAT_COLUMNS), False
+    df_commandes = pd.DataFrame(data).reindex(
+        columns=['id', 'date_commande', 'fournisseur_id', 'montant_total', 'statut', 'items']
+    )
+    if limit is not None and len(df_commandes) > limit:
+        # Plus de commandes que demandé : l'API ignore limit/offset. Filtre, tri (plus récentes d'abord) et découpe ici
+        df_commandes = _filter_commandes(df_commandes, date_from, date_to, statut, fournisseur_id)
+        tri = pd.to_datetime(df_commandes['date_commande'], format='ISO8601', errors='coerce', utc=True)
+        df_commandes = df_commandes.assign(_tri=tri).sort_values(
+            ['_tri', 'id'], ascending=False, na_position='last'
+        ).drop(columns='_tri')
+        page_full = len(df_commandes) > offset + limit
+        df_commandes = df_commandes.iloc[offset:offset + limit]
+    else:
+        # Page pleine jugée sur la réponse brute : le filtre client ne doit pas interrompre la pagination
+        page_full = limit is not None and len(df_commandes) >= limit
+        df_commandes = _filter_commandes(df_commandes, date_from, date_to, statut, fournisseur_id)
+    # Une ligne par article (explode) ; une commande sans article garde une ligne, sans quantité
+    df_items = df_commandes.explode('items', ignore_index=True)
+    is_item = df_items['items'].map(lambda item: isinstance(item, dict))
+    df_lignes = pd.json_normalize([item if ok else {} for item, ok in zip(df_items['items'], is_item)]).reindex(
+        columns=['product_id', 'quantite_commandee', 'prix_unitaire_achat']
+    )
+    df_flat = pd.DataFrame({
+        'commande_id': df_items['id'],
+        'date_commande': df_items['date_commande'],
+        # Statut à faible cardinalité : stocké en catégorie (codes entiers), libellés de l'API conservés
+        'statut': df_items['statut'].fillna('N/A').astype('category'),
+        'cout_total': df_items['montant_total'],
+        # Noms résolus par les dictionnaires en cache (IDs normalisés en clés chaîne)
+        'fournisseur': _id_keys(df_items['fournisseur_id']).map(fournisseur_name_map()),
+        'produit': _id_keys(df_lignes['product_id']).map(product_name_map()),
+        'quantite': df_lignes['quantite_commandee'].fillna(0).where(is_item),
+        'prix_achat': df_lignes['prix_unitaire_achat'],
+    })
+    return df_flat, page_full
+
+def iter_commandes_pages(filters, page_size=COMMANDES_PAGE_SIZE):
+    """
+    Parcourt l'historique filtré bloc par bloc de `page_size` commandes (chaque bloc en cache).
+    Les blocs ne sont demandés qu'au fur et à mesure de la consommation ; arrêt après le premier bloc incomplet.
+    Produit des couples (bloc à plat, bloc plein).
+    """
+    offset = 0
+    while True:
+        page, page_full = load_commandes_flat(**filters, limit=page_size, offset=offset)
+        yield page, page_full
+        if not page_full:
+            return
+        offset += page_size
+
+def clear_catalog_caches():
+    """
+    Invalide uniquement les caches produits / fournisseurs / commandes après une écriture.
+    La liste des utilisateurs et les exports mis en cache restent intacts.
+    """
+    for cached_fn in (get_data_from_api, load_products_data, load_fournisseurs_data, load_products_indexed,
+                      load_products_with_fournisseur, fournisseur_name_map, product_name_map, load_commandes_flat,
+                      load_products_search_index):
+        cached_fn.clear()
 
 # FONCTION CLÉ POUR L'ADMIN : CHARGEMENT DES UTILISATEURS VIA API
-@st.cache_data(ttl=30)
-def load_users_data():
-    """Charge tous les utilisateurs depuis l'API pour l'administrateur."""
-    data = get_data_from_api("/users/") # Nécessite la route /users/ dans l'API
+@st.cache_data(ttl=60, show_spinner=False)
+def load_users_data(current_admin_user):
+    """
+    Charge tous les utilisateurs depuis l'API pour l'administrateur.
+    Le cache est indexé par l'administrateur connecté (la liste l'exclut) et vidé via load_users_data.clear().
+    Retourne (liste des utilisateurs, horodatage du chargement) : l'horodatage identifie la liste en cache.
+    """
+    fetched_at = datetime.now()
+    data = _fetch_api_json("/users/") # Nécessite la route /users/ dans l'API ; pas de second cache à invalider
     if data is None or not isinstance(data, list):
-         return []
+         return [], fetched_at
     
     # Exclure l'administrateur courant et les autres administrateurs de la liste de gestion
-    current_admin_user = st.session_state.username
-    return [u for u in data if u.get('username') != current_admin_user and u.get('is_admin', False) == False]
+    # Test sur 'is_admin' en premier : les administrateurs sont écartés sans lire 'username'
+    return [u for u in data if not u.get('is_admin') and u.get('username') != current_admin_user], fetched_at
 
 # ----------------------------------------------------------------------
 # --- FONCTIONS UTILITAIRES DE GESTION DE SESSION (MISES À JOUR) ---
@@ -166,7 +337,14 @@ def make_hashes(password):
     return hashlib.sha256(str.encode(password)).hexdigest()
 
 # --- Fonctions utilitaires pour le téléchargement (conservées) ---
-@st.cache_data
+def _df_digest(df):
+    """Clé de cache des exports : empreinte vectorisée du contenu (index compris) et des colonnes."""
+    return (tuple(df.columns), pd.util.hash_pandas_object(df, index=True).values.tobytes())
+
+# Les exports sont refaits seulement si le contenu du DataFrame change
+EXPORT_HASH_FUNCS = {pd.DataFrame: _df_digest}
+
+@st.cache_data(hash_funcs=EXPORT_HASH_FUNCS)
 def to_excel(df):
     output = io.BytesIO()
     with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
@@ -174,7 +352,7 @@ def to_excel(df):
     processed_data = output.getvalue()
     return processed_data
 
-@st.cache_data
+@st.cache_data(hash_funcs=EXPORT_HASH_FUNCS)
 def to_plain_text_report(df, title="Rapport"):
     report = f"\n\n*** {title.upper()} ***\n\n"
     report += df.to_string(index=False, justify='left', line_width=120)
@@ -237,14 +415,48 @@ def generate_download_buttons(df, filename_base):
         )
 
 # --- Fonctions de gestion des charges (reste local pour l'instant) ---
+@st.cache_resource
+def _charges_store():
+    """Charges partagées par toutes les sessions du processus (dépenses de l'entreprise, pas de l'utilisateur)."""
+    return {
+        "items": [
+            {"id": 1, "nature": "Salaire", "montant": 200000.0, "date": pd.Timestamp("2025-09-19")},
+            {"id": 2, "nature": "Loyer", "montant": 150000.0, "date": pd.Timestamp("2025-09-20")},
+            {"id": 3, "nature": "Marketing", "montant": 50000.0, "date": pd.Timestamp("2025-09-21")},
+        ],
+        "next_id": 4,
+        # Streamlit sert les sessions sur des threads concurrents
+        "lock": threading.Lock(),
+    }
+
 def add_charge(nature, montant, date):
-    st.session_state.charges_db.append({
-        "id": st.session_state.next_charge_id,
-        "nature": nature,
-        "montant": montant,
-        "date": date
+    store = _charges_store()
+    with store["lock"]:
+        store["items"].append({
+            "id": store["next_id"],
+            "nature": nature,
+            "montant": montant,
+            "date": date
+        })
+        store["next_id"] += 1
+
+# --- Panier : un DataFrame (une colonne par champ) conservé dans la session ---
+# Colonnes du panier -> champs attendus par l'API pour chaque article
+CART_API_FIELDS = {
+    'ID Produit': 'product_id',
+    'Quantité': 'quantite_commandee',
+    'Prix Achat Unitaire (FCFA)': 'prix_unitaire_achat',
+}
+
+def empty_cart_df():
+    """Retourne un panier vide aux colonnes typées."""
+    return pd.DataFrame({
+        'ID Produit': pd.Series(dtype=object),
+        'Produit': pd.Series(dtype=object),
+        'Quantité': pd.Series(dtype='int64'),
+        'Prix Achat Unitaire (FCFA)': pd.Series(dtype='float64'),
+        'Fournisseur ID': pd.Series(dtype=object)
     })
-    st.session_state.next_charge_id += 1
 
 def set_view_admin():
     st.session_state.current_view = "admin"
@@ -258,16 +470,20 @@ def set_auth_mode(mode):
 def logout():
     st.session_state.logged_in = False
     st.session_state.username = None
+    st.session_state.display_name = None
     st.session_state.is_admin = False
     st.session_state.current_view = "admin"
     st.session_state.auth_mode = "login"
     st.session_state.user_data = {} # Vider les données utilisateur de l'API
-    st.session_state.cart = {}
+    st.session_state.users_overrides = {}
+    st.session_state.commandes_pages = 1
+    st.session_state.cart_df = empty_cart_df()
     st.cache_data.clear() 
     st.rerun()
 
+@lru_cache(maxsize=512)
 def get_display_name(username):
-    """Retourne le nom d'affichage."""
+    """Retourne le nom d'affichage (mémorisé par nom d'utilisateur)."""
     return username.capitalize()
 
 # FONCTION D'INSCRIPTION MISE À JOUR (Utilise l'API /register)
@@ -292,6 +508,18 @@ def register_user(username, password, country_code, phone_number):
     else:
         return False, f"Échec de l'inscription : {result}"
 
+def parse_subscription_end_date(user_info):
+    """Convertit une seule fois 'subscription_end_date' (AAAA-MM-JJ) en date, stockée dans user_info."""
+    sub_end_date_str = user_info.get("subscription_end_date")
+    user_info["subscription_end_date_obj"] = None
+    user_info["subscription_end_date_invalid"] = False
+    if sub_end_date_str:
+        try:
+            user_info["subscription_end_date_obj"] = datetime.strptime(sub_end_date_str, "%Y-%m-%d").date()
+        except ValueError:
+            user_info["subscription_end_date_invalid"] = True
+    return user_info
+
 # FONCTION DE VÉRIFICATION D'ABONNEMENT MISE À JOUR (Utilise les données de l'API)
 def check_subscription_status():
     if st.session_state.is_admin:
@@ -302,45 +530,42 @@ def check_subscription_status():
         return False 
 
     if user_info.get("is_active", False):
-        sub_end_date_str = user_info.get("subscription_end_date")
-        
-        if sub_end_date_str:
-            try:
-                sub_end_date = datetime.strptime(sub_end_date_str, "%Y-%m-%d").date()
-                if sub_end_date < datetime.now().date():
-                    # L'abonnement a expiré selon l'API. Déconnexion forcée.
-                    st.session_state.logged_in = False
-                    st.session_state.auth_mode = "login" 
-                    st.error("Votre abonnement a expiré. Veuillez vous reconnecter.")
-                    return False
-            except ValueError:
-                 st.warning("Date d'abonnement invalide reçue de l'API. Contactez l'administrateur.")
-                 return False
+        # Date déjà convertie une fois à la connexion (voir parse_subscription_end_date)
+        if user_info.get("subscription_end_date_invalid"):
+             st.warning("Date d'abonnement invalide reçue de l'API. Contactez l'administrateur.")
+             return False
+        sub_end_date = user_info.get("subscription_end_date_obj")
+        if sub_end_date and sub_end_date < datetime.now().date():
+            # L'abonnement a expiré selon l'API. Déconnexion forcée.
+            st.session_state.logged_in = False
+            st.session_state.auth_mode = "login" 
+            st.error("Votre abonnement a expiré. Veuillez vous reconnecter.")
+            return False
         return True
     
     return False
 
 # --- Initialisation de l'état de la session (NETTOYÉ) ---
-if "charges_db" not in st.session_state:
-    st.session_state.charges_db = [
-        {"id": 1, "nature": "Salaire", "montant": 200000.0, "date": "2025-09-19"},
-        {"id": 2, "nature": "Loyer", "montant": 150000.0, "date": "2025-09-20"},
-        {"id": 3, "nature": "Marketing", "montant": 50000.0, "date": "2025-09-21"},
-    ]
-if "next_charge_id" not in st.session_state:
-    st.session_state.next_charge_id = 4 
-
-if "user_settings" not in st.session_state: st.session_state.user_settings = {} 
-if "cart" not in st.session_state: st.session_state.cart = {} 
-
-# --- NOUVELLE INITIALISATION : Données Utilisateur (Venant de l'API) ---
-if "user_data" not in st.session_state: st.session_state.user_data = {} 
-
-if "logged_in" not in st.session_state: st.session_state.logged_in = False
-if "username" not in st.session_state: st.session_state.username = None
-if "is_admin" not in st.session_state: st.session_state.is_admin = False
-if "current_view" not in st.session_state: st.session_state.current_view = "client"
-if "auth_mode" not in st.session_state: st.session_state.auth_mode = "login"
+SESSION_DEFAULTS = {
+    "user_settings": {},
+    # Données Utilisateur (Venant de l'API)
+    "user_data": {},
+    # Modifications d'abonnement confirmées par l'API, appliquées par-dessus la liste des utilisateurs en cache
+    # ({'fetched_at': horodatage de cette liste, 'users': {nom: changements}})
+    "users_overrides": {},
+    "logged_in": False,
+    "username": None,
+    "display_name": None,
+    "is_admin": False,
+    "current_view": "client",
+    "auth_mode": "login",
+    # Nombre de pages de l'historique des commandes affichées ("Charger plus")
+    "commandes_pages": 1,
+}
+for key, default in SESSION_DEFAULTS.items():
+    st.session_state.setdefault(key, default)
+# Le panier vide n'est construit que s'il manque
+if "cart_df" not in st.session_state: st.session_state.cart_df = empty_cart_df() 
 
 
 # ----------------------------------------------------------------------
@@ -353,78 +578,89 @@ def show_password_reset():
     st.markdown("---")
     if st.button("Retour à la connexion", key="back_to_login_btn"):
         set_auth_mode("login")
+        st.rerun(scope="fragment") # Afficher tout de suite le formulaire de connexion (fragment d'authentification)
 
 # FONCTION DE CONNEXION MISE À JOUR (Utilise l'API /login)
-def show_login_page():
-    st.title("Connexion - Gestion des Achats")
-    st.markdown("---")
-
+@st.fragment
+def _auth_fragment():
+    """
+    Formulaires connexion / inscription / réinitialisation : les changements de mode ne relancent que ce fragment.
+    Une connexion réussie appelle st.rerun(), qui relance toute l'application.
+    """
     if st.session_state.auth_mode == "reset":
         show_password_reset()
         return
 
-    col1, col2 = st.columns(2)
-    with col1:
-        if st.session_state.auth_mode == "login":
-            st.subheader("Se connecter")
-            with st.form("login_form"):
-                username = st.text_input("Nom d'utilisateur")
-                password = st.text_input("Mot de passe", type="password")
-                login_button = st.form_submit_button("Se connecter", type="primary")
+    if st.session_state.auth_mode == "login":
+        st.subheader("Se connecter")
+        with st.form("login_form"):
+            username = st.text_input("Nom d'utilisateur")
+            password = st.text_input("Mot de passe", type="password")
+            login_button = st.form_submit_button("Se connecter", type="primary")
+            
+            if login_button:
+                login_payload = {
+                    "username": username,
+                    "password": password 
+                }
+                # Appel API pour se connecter (POST /login)
+                success, result = handle_api_request("POST", "/login", data=login_payload)
                 
-                if login_button:
-                    login_payload = {
-                        "username": username,
-                        "password": password 
-                    }
-                    # Appel API pour se connecter (POST /login)
-                    success, result = handle_api_request("POST", "/login", data=login_payload)
+                if success:
+                    user_info = parse_subscription_end_date(result) 
                     
-                    if success:
-                        user_info = result 
-                        
-                        st.session_state.logged_in = True
-                        st.session_state.username = user_info.get("username", username)
-                        st.session_state.is_admin = user_info.get("is_admin", False)
-                        st.session_state.user_data = user_info 
-                        
-                        st.success(f"Connexion réussie pour {st.session_state.username} !")
-                        st.rerun()
-                    else:
-                        st.error(f"Nom d'utilisateur ou mot de passe incorrect : {result}")
-            
+                    st.session_state.logged_in = True
+                    st.session_state.username = user_info.get("username", username)
+                    st.session_state.is_admin = user_info.get("is_admin", False)
+                    st.session_state.user_data = user_info 
+                    # Nom d'affichage calculé une fois par connexion, relu tel quel à chaque rerun
+                    st.session_state.display_name = get_display_name(st.session_state.username)
+                    
+                    st.success(f"Connexion réussie pour {st.session_state.username} !")
+                    st.rerun()
+                else:
+                    st.error(f"Nom d'utilisateur ou mot de passe incorrect : {result}")
+        
+        st.markdown("---")
+        col_links = st.columns(2)
+        with col_links[0]:
+            st.button("Créer un compte", on_click=lambda: set_auth_mode("register"))
+        with col_links[1]:
+            st.button("Mot de passe oublié ?", on_click=lambda: set_auth_mode("reset"))
+
+    elif st.session_state.auth_mode == "register":
+        st.subheader("Créer un compte client")
+        with st.form("register_form"):
+            new_username = st.text_input("Nom d'utilisateur souhaité")
+            new_password = st.text_input("Mot de passe", type="password")
             st.markdown("---")
-            col_links = st.columns(2)
-            with col_links[0]:
-                st.button("Créer un compte", on_click=lambda: set_auth_mode("register"))
-            with col_links[1]:
-                st.button("Mot de passe oublié ?", on_click=lambda: set_auth_mode("reset"))
-
-        elif st.session_state.auth_mode == "register":
-            st.subheader("Créer un compte client")
-            with st.form("register_form"):
-                new_username = st.text_input("Nom d'utilisateur souhaité")
-                new_password = st.text_input("Mot de passe", type="password")
-                st.markdown("---")
-                st.markdown("**Contact :**")
-                col_code, col_phone = st.columns([1, 2])
-                with col_code:
-                    new_country_code = st.text_input("Indicatif Pays", value=DEFAULT_COUNTRY_CODE)
-                with col_phone:
-                    new_phone_number = st.text_input("Numéro de Téléphone (sans l'indicatif)")
-                st.markdown("---")
-                register_button = st.form_submit_button("S'inscrire", type="primary")
-
-                if register_button:
-                    success, message = register_user(new_username, new_password, new_country_code, new_phone_number)
-                    if success:
-                        st.success(message)
-                        st.info(f"Veuillez vous connecter et effectuer le paiement des **5000 FCFA** pour activer votre abonnement auprès de l'administrateur.")
-                        set_auth_mode("login")
-                    else:
-                        st.error(message)
+            st.markdown("**Contact :**")
+            col_code, col_phone = st.columns([1, 2])
+            with col_code:
+                new_country_code = st.text_input("Indicatif Pays", value=DEFAULT_COUNTRY_CODE)
+            with col_phone:
+                new_phone_number = st.text_input("Numéro de Téléphone (sans l'indicatif)")
             st.markdown("---")
-            st.button("Se connecter", on_click=lambda: set_auth_mode("login"))
+            register_button = st.form_submit_button("S'inscrire", type="primary")
+
+            if register_button:
+                success, message = register_user(new_username, new_password, new_country_code, new_phone_number)
+                if success:
+                    st.success(message)
+                    st.info(f"Veuillez vous connecter et effectuer le paiement des **5000 FCFA** pour activer votre abonnement auprès de l'administrateur.")
+                    set_auth_mode("login")
+                else:
+                    st.error(message)
+        st.markdown("---")
+        st.button("Se connecter", on_click=lambda: set_auth_mode("login"))
+
+def show_login_page():
+    st.title("Connexion - Gestion des Achats")
+    st.markdown("---")
+
+    col1, col2 = st.columns(2)
+    with col1:
+        _auth_fragment()
 
     with col2:
         st.header("Note Importante pour l'Abonnement")
@@ -461,11 +697,20 @@ def show_payment_page():
 def show_charge_management():
     """Gestion des charges dans le dashboard admin (reste locale pour l'instant)."""
     st.header("Gestion des Charges (Dépenses) - ⚠️ Locale")
-    df_charges = pd.DataFrame(st.session_state.charges_db)
+    # Dates déjà stockées en pd.Timestamp ; le montant reste numérique et n'est formaté qu'à l'affichage
+    store = _charges_store()
+    with store["lock"]:
+        charges = list(store["items"])
+    df_charges = pd.DataFrame(charges).rename(columns={'montant': 'Montant (FCFA)'})
     if not df_charges.empty:
-        df_charges['date'] = pd.to_datetime(df_charges['date'])
-        df_charges['Montant (FCFA)'] = df_charges['montant'].apply(lambda x: f"{x:,.0f} FCFA")
-        st.dataframe(df_charges.drop(columns=['montant']), hide_index=True, use_container_width=True)
+        st.dataframe(
+            df_charges, 
+            hide_index=True, 
+            use_container_width=True,
+            column_config={
+                "Montant (FCFA)": st.column_config.NumberColumn("Montant (FCFA)", format="%.0f FCFA"),
+            }
+        )
         generate_download_buttons(df_charges, "rapport_charges")
 
     with st.expander("➕ Ajouter une Nouvelle Charge"):
@@ -477,32 +722,67 @@ def show_charge_management():
 
             if add_charge_button:
                 if new_nature and new_montant > 0:
-                    add_charge(new_nature, new_montant, new_date.strftime("%Y-%m-%d"))
+                    add_charge(new_nature, new_montant, pd.Timestamp(new_date))
                     st.success(f"Charge '{new_nature}' de {new_montant:,.0f} FCFA ajoutée.")
                     st.rerun()
                 else:
                     st.error("Veuillez remplir la nature et un montant valide.")
 
 
+def update_user_in_cache(username, payload, result):
+    """
+    Mise à jour optimiste après un PUT réussi : l'utilisateur renvoyé par l'API (ou, à défaut, le payload envoyé)
+    est superposé à la liste en cache, ce qui évite de recharger toute la liste /users/.
+    La superposition ne vaut que pour la liste affichée (voir show_admin_dashboard).
+    """
+    changes = result if isinstance(result, dict) and result.get('username') == username else payload
+    st.session_state.users_overrides.setdefault('users', {})[username] = {
+        k: changes[k] for k in ('is_active', 'subscription_end_date') if k in changes
+    }
+
+def bulk_update_subscriptions(usernames, payload):
+    """
+    Applique le même payload d'abonnement à plusieurs utilisateurs sur une seule connexion poolée.
+    L'API n'expose pas de route groupée : un PUT par utilisateur, sans nouvelle poignée de main TLS.
+    Retourne (liste des utilisateurs mis à jour, liste des erreurs).
+    """
+    http = _http()
+    updated, errors = [], []
+    for username in usernames:
+        try:
+            response = http.put(f"{FASTAPI_BASE_URL}/users/{username}/subscription", json=payload, timeout=API_TIMEOUT)
+            response.raise_for_status()
+            result = response.json() if response.content else {}
+            update_user_in_cache(username, payload, result)
+            updated.append(username)
+        except RequestException as e:
+            errors.append(f"{username} : {e}")
+    return updated, errors
+
 # DASHBOARD ADMIN AVEC GESTION DES UTILISATEURS VIA API
 def show_admin_dashboard():
     st.title("Tableau de Bord Administrateur")
     st.button("Voir l'espace client", on_click=set_view_client)
     st.header("Gestion des Utilisateurs")
     
-    users_list = load_users_data() # APPEL API
+    users_list, fetched_at = load_users_data(st.session_state.username) # APPEL API (en cache par administrateur)
+    # Les modifications superposées sont liées à la liste en cache sur laquelle elles ont été faites :
+    # une liste rechargée (après le TTL) reflète déjà le serveur, elles sont alors abandonnées
+    if st.session_state.users_overrides.get('fetched_at') != fetched_at:
+        st.session_state.users_overrides = {'fetched_at': fetched_at, 'users': {}}
+    # Appliquer les modifications d'abonnement déjà confirmées par l'API (sans recharger /users/)
+    overrides = st.session_state.users_overrides['users']
+    if overrides:
+        users_list = [{**u, **overrides[u.get('username')]} if u.get('username') in overrides else u for u in users_list]
     
-    user_data = []
-    for user_info in users_list:
-        sub_end = user_info.get("subscription_end_date")
-        user_data.append({
-            "Nom d'utilisateur": user_info.get('username'),
-            "Téléphone": f"{user_info.get('country_code', '')}{user_info.get('phone_number')}",
-            "Statut d'abonnement": "🟢 Actif" if user_info.get("is_active") else "🔴 Inactif",
-            "Date d'expiration": sub_end if sub_end else "N/A"
-        })
-    
-    df_users = pd.DataFrame(user_data)
+    # Construction colonne par colonne (pas de dictionnaire Python par utilisateur)
+    df_raw = pd.DataFrame(users_list).reindex(columns=['username', 'country_code', 'phone_number', 'is_active', 'subscription_end_date'])
+    df_users = pd.DataFrame({
+        "Nom d'utilisateur": df_raw['username'],
+        "Téléphone": df_raw['country_code'].fillna('').astype(str) + df_raw['phone_number'].astype(str),
+        "Statut d'abonnement": np.where(df_raw['is_active'].fillna(False).astype(bool), "🟢 Actif", "🔴 Inactif"),
+        "Date d'expiration": df_raw['subscription_end_date'].fillna('').replace('', 'N/A')
+    })
     st.dataframe(df_users, hide_index=True, use_container_width=True)
     
     st.subheader("Modifier l'abonnement d'un utilisateur")
@@ -527,11 +807,11 @@ def show_admin_dashboard():
                     new_end_date = (datetime.now().date() + timedelta(days=30)).strftime("%Y-%m-%d")
                     # Appel API pour activation/prolongation (PUT /users/{username}/subscription)
                     payload = {"is_active": True, "subscription_end_date": new_end_date}
-                    success, result = handle_api_request("PUT", f"/users/{user_to_update_name}/subscription", data=payload)
+                    success, result = handle_api_request("PUT", f"/users/{user_to_update_name}/subscription", data=payload, clear_cache=False)
                     
                     if success:
                         st.success(f"Abonnement de **{user_to_update_name}** activé/prolongé jusqu'au **{new_end_date}**.")
-                        st.cache_data.clear() 
+                        update_user_in_cache(user_to_update_name, payload, result)
                         st.rerun()
                     else:
                         st.error(f"Échec de l'activation : {result}")
@@ -541,17 +821,28 @@ def show_admin_dashboard():
                     if st.button("🔴 Suspendre l'abonnement", key="btn_suspend"):
                         # Appel API pour suspension (PUT /users/{username}/subscription)
                         payload = {"is_active": False, "subscription_end_date": current_info.get('subscription_end_date')}
-                        success, result = handle_api_request("PUT", f"/users/{user_to_update_name}/subscription", data=payload)
+                        success, result = handle_api_request("PUT", f"/users/{user_to_update_name}/subscription", data=payload, clear_cache=False)
                         
                         if success:
                             st.warning(f"Abonnement de **{user_to_update_name}** suspendu.")
-                            st.cache_data.clear()
+                            update_user_in_cache(user_to_update_name, payload, result)
                             st.rerun()
                         else:
                             st.error(f"Échec de la suspension : {result}")
                 else:
                     st.info("L'abonnement est déjà suspendu ou expiré.")
 
+        st.markdown("**Activation groupée**")
+        users_to_activate = st.multiselect("Utilisateurs à activer / prolonger (1 Mois)", options=user_usernames, key="admin_bulk_select")
+        if st.button("Activer la sélection", key="btn_bulk_activate", disabled=not users_to_activate):
+            new_end_date = (datetime.now().date() + timedelta(days=30)).strftime("%Y-%m-%d")
+            updated, errors = bulk_update_subscriptions(users_to_activate, {"is_active": True, "subscription_end_date": new_end_date})
+            for error in errors:
+                st.error(f"Échec de l'activation : {error}")
+            if updated:
+                st.success(f"{len(updated)} abonnement(s) activé(s)/prolongé(s) jusqu'au **{new_end_date}**.")
+                st.rerun()
+
     st.markdown("---")
     show_charge_management()
 
@@ -572,50 +863,34 @@ def submit_purchase_order(fournisseur_id, total_montant, items):
         "cout_total": total_montant 
     }
     
-    success, result = handle_api_request('POST', '/commandes/', data=commande_data)
+    success, result = handle_api_request('POST', '/commandes/', data=commande_data, clear_cache=False)
     
     if success:
-        st.session_state.cart = {} 
-        st.cache_data.clear() 
+        st.session_state.cart_df = empty_cart_df() 
+        clear_catalog_caches() # Stocks et historique modifiés par la commande
     
     return success, result
 
-def show_cart_summary(df_fournisseurs):
+def show_cart_summary():
     st.markdown("---")
     st.subheader("🛒 Récapitulatif du Panier d'Achat")
     
-    if not st.session_state.cart:
+    df_cart = st.session_state.cart_df
+    if df_cart.empty:
         st.info("Le panier est vide.")
         return
 
-    cart_list = []
-    total_montant = 0
-    first_fournisseur_id = None
-    
-    for product_id, item in st.session_state.cart.items():
-        montant_item = item['quantity'] * item['price_achat']
-        total_montant += montant_item
-        
-        if first_fournisseur_id is None:
-            first_fournisseur_id = item['fournisseur_id']
-        elif first_fournisseur_id != item['fournisseur_id']:
-            pass 
-
-        fournisseur_name = df_fournisseurs[df_fournisseurs['ID Fournisseur'] == item['fournisseur_id']]['Nom Fournisseur'].iloc[0] if not df_fournisseurs.empty and item['fournisseur_id'] in df_fournisseurs['ID Fournisseur'].values else "Inconnu"
-
-        cart_list.append({
-            'ID Produit': product_id,
-            'Produit': item['product_name'],
-            'Quantité': item['quantity'],
-            "Prix Achat Unitaire (FCFA)": item['price_achat'],
-            'Montant (FCFA)': montant_item,
-            'Fournisseur': fournisseur_name
-        })
-
-    df_cart = pd.DataFrame(cart_list)
+    # Montants et total calculés sur les colonnes du panier (pas de boucle par article)
+    montants = df_cart['Quantité'] * df_cart['Prix Achat Unitaire (FCFA)']
+    total_montant = montants.sum()
+    first_fournisseur_id = df_cart['Fournisseur ID'].iloc[0]
+    df_cart_display = df_cart.assign(**{
+        'Montant (FCFA)': montants,
+        'Fournisseur': df_cart['Fournisseur ID'].astype(str).map(fournisseur_name_map()).fillna("Inconnu")
+    })
     
     st.dataframe(
-        df_cart[['Produit', 'Quantité', 'Prix Achat Unitaire (FCFA)', 'Montant (FCFA)', 'Fournisseur']], 
+        df_cart_display[['Produit', 'Quantité', 'Prix Achat Unitaire (FCFA)', 'Montant (FCFA)', 'Fournisseur']], 
         hide_index=True, 
         use_container_width=True,
         column_config={
@@ -631,16 +906,14 @@ def show_cart_summary(df_fournisseurs):
     with col_submit:
         if st.button("✅ Soumettre la Commande d'Achat", type="primary"):
             if first_fournisseur_id:
-                items_for_api = [
-                    {"product_id": item['ID Produit'], "quantite_commandee": item['Quantité'], "prix_unitaire_achat": item['Prix Achat Unitaire (FCFA)']}
-                    for item in cart_list
-                ]
+                # to_dict('records') renvoie des types Python natifs, directement sérialisables en JSON
+                items_for_api = df_cart.rename(columns=CART_API_FIELDS)[list(CART_API_FIELDS.values())].to_dict('records')
                 
-                success, result = submit_purchase_order(first_fournisseur_id, total_montant, items_for_api)
+                success, result = submit_purchase_order(first_fournisseur_id, float(total_montant), items_for_api)
                 
                 if success:
                     st.success(f"Commande d'Achat soumise avec succès ! ID: {result.get('id', 'N/A')}")
-                    st.session_state.cart = {} 
+                    st.session_state.cart_df = empty_cart_df() 
                     st.rerun()
                 else:
                     st.error(f"Échec de la soumission de la commande : {result}")
@@ -649,19 +922,52 @@ def show_cart_summary(df_fournisseurs):
                  
     with col_clear:
         if st.button("🗑️ Vider le Panier"):
-            st.session_state.cart = {}
+            st.session_state.cart_df = empty_cart_df()
             st.success("Panier vidé.")
-            st.rerun()
-
-def show_product_management(df_products, df_fournisseurs):
-    df_prods_display = df_products.copy()
-    if not df_fournisseurs.empty and 'ID Fournisseur' in df_prods_display.columns:
-        df_prods_display = df_prods_display.merge(
-            df_fournisseurs[['ID Fournisseur', 'Nom Fournisseur']], 
-            on='ID Fournisseur', 
-            how='left'
-        )
-        df_prods_display['Nom Fournisseur'] = df_prods_display['Nom Fournisseur'].fillna('Non défini')
+            st.rerun(scope="fragment") # Seul le panier change : inutile de relancer toute l'application
+
+def _price_columns_digest(df):
+    """Empreinte des seules colonnes utilisées par l'analyse des marges."""
+    cols = [c for c in ('ID Produit', 'Produit', 'Prix Achat Unitaire (FCFA)', 'Prix Vente Unitaire (FCFA)') if c in df.columns]
+    return pd.util.hash_pandas_object(df[cols], index=False).values.tobytes()
+
+@st.cache_data(hash_funcs={pd.DataFrame: _price_columns_digest})
+def _compute_margins(df):
+    """Ajoute 'Marge Brute (FCFA)' et 'Marge %' à une copie des produits."""
+    df_analysis = df.copy()
+    df_analysis['Prix Achat Unitaire (FCFA)'] = pd.to_numeric(df_analysis['Prix Achat Unitaire (FCFA)'], errors='coerce').fillna(0)
+    df_analysis['Prix Vente Unitaire (FCFA)'] = pd.to_numeric(df_analysis['Prix Vente Unitaire (FCFA)'], errors='coerce').fillna(0)
+    
+    df_analysis['Marge Brute (FCFA)'] = df_analysis['Prix Vente Unitaire (FCFA)'] - df_analysis['Prix Achat Unitaire (FCFA)']
+    # Division protégée : 0 % quand le prix d'achat est nul, en une seule passe NumPy
+    marge = df_analysis['Marge Brute (FCFA)'].to_numpy(dtype='float64')
+    achat = df_analysis['Prix Achat Unitaire (FCFA)'].to_numpy(dtype='float64')
+    marge_pct = np.zeros_like(achat)
+    np.divide(marge, achat, out=marge_pct, where=achat != 0)
+    df_analysis['Marge %'] = marge_pct * 100
+    return df_analysis
+
+@st.cache_resource
+def _plotly():
+    """Import différé de plotly.express : les pages de connexion et de paiement n'en ont pas besoin."""
+    import plotly.express as px
+    return px
+
+@st.cache_data(hash_funcs={pd.DataFrame: _price_columns_digest})
+def _margin_figure(df_analysis):
+    """Graphique des marges brutes par produit (la marge dérive des prix, couverts par l'empreinte)."""
+    return _plotly().bar(
+        df_analysis.sort_values('Marge Brute (FCFA)', ascending=False),
+        x='Produit', 
+        y='Marge Brute (FCFA)',
+        color='Marge Brute (FCFA)',
+        title='Marge Brute par Produit (FCFA)',
+        labels={'Marge Brute (FCFA)': 'Marge Brute (FCFA)'}
+    )
+
+def show_product_management(df_products):
+    # Jointure produits / fournisseurs mise en cache (mêmes loaders que df_products et df_fournisseurs)
+    df_prods_display = load_products_with_fournisseur()
     
     st.title("Gestion des Produits et Commandes d'Achat")
 
@@ -670,6 +976,11 @@ def show_product_management(df_products, df_fournisseurs):
 
     with tab_produits:
         st.subheader("Inventaire Actuel des Produits")
+        recherche = st.text_input("Rechercher un produit", key="recherche_produit")
+        if recherche and not df_prods_display.empty:
+            # Sous-chaîne littérale sur les noms déjà en minuscules (pas d'expression régulière)
+            mask = load_products_search_index().str.contains(recherche.lower(), regex=False, na=False)
+            df_prods_display = df_prods_display.loc[mask]
         if not df_prods_display.empty:
             cols_to_display = [
                 'ID Produit', 'Produit', 'Stock Actuel', 
@@ -696,13 +1007,8 @@ def show_product_management(df_products, df_fournisseurs):
     with tab_analyse:
         st.subheader("Analyse des Marge et des Prix")
         if not df_products.empty:
-            df_analysis = df_products.copy()
-            df_analysis['Prix Achat Unitaire (FCFA)'] = pd.to_numeric(df_analysis['Prix Achat Unitaire (FCFA)'], errors='coerce').fillna(0)
-            df_analysis['Prix Vente Unitaire (FCFA)'] = pd.to_numeric(df_analysis['Prix Vente Unitaire (FCFA)'], errors='coerce').fillna(0)
-            
-            df_analysis['Marge Brute (FCFA)'] = df_analysis['Prix Vente Unitaire (FCFA)'] - df_analysis['Prix Achat Unitaire (FCFA)']
-            df_analysis['Marge %'] = (df_analysis['Marge Brute (FCFA)'] / df_analysis['Prix Achat Unitaire (FCFA)']) * 100
-            df_analysis['Marge %'] = df_analysis['Marge %'].replace([float('inf'), float('-inf')], 0).fillna(0)
+            # Marges et graphique recalculés uniquement quand les prix changent (cache sur l'empreinte des colonnes)
+            df_analysis = _compute_margins(df_products)
 
             st.dataframe(
                 df_analysis[[
@@ -722,91 +1028,90 @@ def show_product_management(df_products, df_fournisseurs):
                 }
             )
             
-            fig = px.bar(
-                df_analysis.sort_values('Marge Brute (FCFA)', ascending=False),
-                x='Produit', 
-                y='Marge Brute (FCFA)',
-                color='Marge Brute (FCFA)',
-                title='Marge Brute par Produit (FCFA)',
-                labels={'Marge Brute (FCFA)': 'Marge Brute (FCFA)'}
-            )
-            st.plotly_chart(fig, use_container_width=True)
+            st.plotly_chart(_margin_figure(df_analysis), use_container_width=True)
 
         else:
             st.info("Aucune donnée de produit pour l'analyse.")
 
     with tab_commande:
-        st.subheader("Ajouter un Produit au Panier d'Achat (Nouvelle Commande)")
-        
-        if df_products.empty:
-            st.error("Aucun produit trouvé. Veuillez en ajouter un d'abord.")
-            return
+        show_cart_tab(df_products)
 
-        product_options = {
-            f"{str(row['Produit'])} (Stock: {int(row['Stock Actuel']):,})": str(row['ID Produit'])
-            for _, row in df_products.iterrows()
-            if row.get('ID Produit') is not None and row.get('Produit') is not None
-        }
+@st.fragment
+def show_cart_tab(df_products):
+    """Onglet « Nouvelle Commande » : fragment relancé seul lors des choix de produit, quantité et ajouts au panier."""
+    st.subheader("Ajouter un Produit au Panier d'Achat (Nouvelle Commande)")
+    
+    if df_products.empty:
+        st.error("Aucun produit trouvé. Veuillez en ajouter un d'abord.")
+        return
 
-        if not product_options:
-            st.warning("Aucun produit avec un ID valide n'a pu être chargé. (Vérifiez la base de données).")
-            return
-            
-        product_display_names = list(product_options.keys())
-        selected_display_name = st.selectbox(
-            "Sélectionner un produit pour la commande",
-            product_display_names,
-            key="selected_product_cart"
-        )
+    # Libellés construits colonne par colonne (pas d'iterrows)
+    df_valid = df_products.dropna(subset=['ID Produit', 'Produit'])
+    labels = df_valid['Produit'].astype(str) + " (Stock: " + df_valid['Stock Actuel'].astype('int64').map('{:,}'.format) + ")"
+    product_options = dict(zip(labels, df_valid['ID Produit'].astype(str)))
+
+    if not product_options:
+        st.warning("Aucun produit avec un ID valide n'a pu être chargé. (Vérifiez la base de données).")
+        return
         
-        selected_product_id = product_options.get(selected_display_name)
+    product_display_names = list(product_options.keys())
+    selected_display_name = st.selectbox(
+        "Sélectionner un produit pour la commande",
+        product_display_names,
+        key="selected_product_cart"
+    )
+    
+    selected_product_id = product_options.get(selected_display_name)
 
-        if selected_product_id:
-            selected_row = df_products[df_products['ID Produit'] == selected_product_id].iloc[0]
-            current_stock = selected_row['Stock Actuel'] 
-            achat_price = selected_row['Prix Achat Unitaire (FCFA)']
-            
-            col_qty, _ = st.columns([1, 4])
-
-            with col_qty:
-                quantity = st.number_input(
-                    "Quantité à Commander", 
-                    min_value=1, 
-                    max_value=None, 
-                    value=1, 
-                    step=1, 
-                    key="cart_quantity"
-                )
-            
-            st.markdown(f"""
-            **Stock Actuel:** **{current_stock:,.0f}**
-            
-            **Prix unitaire d'achat:** **{achat_price:,.0f} FCFA** (Le prix final sera utilisé lors de la soumission de la commande via l'API)
-            """)
+    if selected_product_id:
+        selected_row = load_products_indexed().loc[selected_product_id] # Accès par index (ID en chaîne)
+        current_stock = selected_row['Stock Actuel'] 
+        achat_price = selected_row['Prix Achat Unitaire (FCFA)']
+        
+        col_qty, _ = st.columns([1, 4])
+
+        with col_qty:
+            quantity = st.number_input(
+                "Quantité à Commander", 
+                min_value=1, 
+                max_value=None, 
+                value=1, 
+                step=1, 
+                key="cart_quantity"
+            )
+        
+        st.markdown(f"""
+        **Stock Actuel:** **{current_stock:,.0f}**
+        
+        **Prix unitaire d'achat:** **{achat_price:,.0f} FCFA** (Le prix final sera utilisé lors de la soumission de la commande via l'API)
+        """)
 
-            is_add_disabled = (quantity < 1) 
+        is_add_disabled = (quantity < 1) 
 
-            if st.button("🛒 Ajouter au Panier", type="primary", disabled=is_add_disabled):
-                if selected_product_id in st.session_state.cart:
-                    st.session_state.cart[selected_product_id]['quantity'] += int(quantity)
-                else:
-                    st.session_state.cart[selected_product_id] = {
-                        'product_name': selected_row['Produit'],
-                        'quantity': int(quantity),
-                        'price_achat': achat_price,
-                        'fournisseur_id': selected_row['ID Fournisseur'],
-                        'current_stock': current_stock 
-                    }
-                st.success(f"**{int(quantity)} x {selected_row['Produit']}** ajouté(s) au panier.")
-                st.rerun() 
-            
-            if is_add_disabled:
-                st.info("Veuillez entrer une quantité pour ajouter au panier.")
-            
-            show_cart_summary(df_fournisseurs)
-        else:
-            st.warning("Veuillez sélectionner un produit.")
-            
+        if st.button("🛒 Ajouter au Panier", type="primary", disabled=is_add_disabled):
+            df_cart = st.session_state.cart_df
+            mask = df_cart['ID Produit'] == selected_product_id
+            if mask.any():
+                df_cart.loc[mask, 'Quantité'] += int(quantity)
+            else:
+                new_line = pd.DataFrame({
+                    'ID Produit': [selected_product_id],
+                    'Produit': [selected_row['Produit']],
+                    'Quantité': [int(quantity)],
+                    'Prix Achat Unitaire (FCFA)': [float(achat_price)],
+                    'Fournisseur ID': [selected_row['ID Fournisseur']]
+                })
+                st.session_state.cart_df = new_line if df_cart.empty else pd.concat([df_cart, new_line], ignore_index=True)
+            # Pas de st.rerun() : le récapitulatif ci-dessous est redessiné dans le même passage du fragment
+            st.success(f"**{int(quantity)} x {selected_row['Produit']}** ajouté(s) au panier.")
+        
+        if is_add_disabled:
+            st.info("Veuillez entrer une quantité pour ajouter au panier.")
+        
+        show_cart_summary()
+    else:
+        st.warning("Veuillez sélectionner un produit.")
+        
 def show_fournisseur_management(df_fournisseurs):
     st.title("Gestion des Fournisseurs")
     if not df_fournisseurs.empty:
@@ -815,38 +1120,39 @@ def show_fournisseur_management(df_fournisseurs):
         st.info("Aucun fournisseur trouvé.")
     st.warning("Section en cours de construction pour l'ajout/modification.")
 
-def show_command_history(commandes_data, df_fournisseurs, df_products):
+def show_command_history(filters):
     st.title("Historique des Commandes d'Achat")
-    if commandes_data:
-        df_commandes = pd.DataFrame(commandes_data)
-        
-        all_items = []
-        for index, row in df_commandes.iterrows():
-            commande_id = row.get('id', 'N/A')
-            date_commande = row.get('date_commande', 'N/A')[:10]
-            fournisseur_id = row.get('fournisseur_id', 'N/A')
-            montant_total = row.get('montant_total', 0)
-            statut = row.get('statut', 'N/A')
-            
-            fournisseur_name = df_fournisseurs[df_fournisseurs['ID Fournisseur'] == str(fournisseur_id)]['Nom Fournisseur'].iloc[0] if not df_fournisseurs.empty and str(fournisseur_id) in df_fournisseurs['ID Fournisseur'].astype(str).values else "Inconnu"
-
-            for item in row.get('items', []):
-                product_id = item.get('product_id', 'N/A')
-                product_name = df_products[df_products['ID Produit'] == str(product_id)]['Produit'].iloc[0] if not df_products.empty and str(product_id) in df_products['ID Produit'].astype(str).values else "Produit Inconnu"
-                
-                all_items.append({
-                    'ID Commande': commande_id,
-                    'Date': date_commande,
-                    'Fournisseur': fournisseur_name,
-                    'Produit': product_name,
-                    'Quantité': item.get('quantite_commandee', 0),
-                    'Prix Achat Unitaire': item.get('prix_unitaire_achat', 0),
-                    'Statut': statut,
-                    'Total Commande (FCFA)': montant_total
-                })
-        
-        if all_items:
-            df_history = pd.DataFrame(all_items)
+    # Retour à la première page quand les filtres changent
+    if st.session_state.get("commandes_pages_filters") != filters:
+        st.session_state.commandes_pages_filters = filters
+        st.session_state.commandes_pages = 1
+    # Pages chargées à la demande (chacune en cache) : la première s'affiche sans attendre tout l'historique
+    chunks = list(islice(iter_commandes_pages(filters), st.session_state.commandes_pages))
+    pages = [page for page, _ in chunks]
+    # Une commande n'est gardée que dans la première page qui la contient (API ignorant offset : pages répétées)
+    df_flat = pd.concat(pages, keys=range(len(pages)), names=['page', None]).reset_index(level='page')
+    first_page = df_flat.groupby('commande_id')['page'].transform('min')
+    new_in_last = (first_page == len(pages) - 1).any()
+    df_flat = df_flat[df_flat['page'] == first_page].drop(columns='page').reset_index(drop=True)
+    # Page suivante proposée seulement si la dernière était pleine et a apporté de nouvelles commandes
+    has_more = chunks[-1][1] and (pages[-1].empty or new_in_last)
+    # Pages aux catégories différentes : pd.concat repasse en object, catégories unifiées sur l'ensemble
+    df_flat['statut'] = df_flat['statut'].astype('category')
+    if not df_flat.empty:
+        # Lignes déjà aplaties (en cache) : les commandes sans article n'ont pas de quantité
+        df_items = df_flat.dropna(subset=['quantite'])
+
+        if not df_items.empty:
+            df_history = pd.DataFrame({
+                'ID Commande': df_items['commande_id'],
+                'Date': df_items['date_commande'].fillna('N/A').astype(str).str[:10],
+                'Fournisseur': df_items['fournisseur'].fillna("Inconnu"),
+                'Produit': df_items['produit'].fillna("Produit Inconnu"),
+                'Quantité': df_items['quantite'],
+                'Prix Achat Unitaire': df_items['prix_achat'].fillna(0),
+                'Statut': df_items['statut'],
+                'Total Commande (FCFA)': df_items['cout_total'].fillna(0)
+            })
             st.dataframe(
                 df_history, 
                 hide_index=True, 
@@ -862,6 +1168,12 @@ def show_command_history(commandes_data, df_fournisseurs, df_products):
     else:
         st.info("Aucune commande enregistrée pour le moment.")
     
+    # Une page pleine (réponse brute de l'API) laisse supposer qu'il reste des commandes plus anciennes,
+    # même si le filtre client a vidé les pages déjà chargées
+    if has_more and st.button("Charger plus", key="commandes_load_more"):
+        st.session_state.commandes_pages += 1
+        st.rerun()
+    
     st.warning("Section en cours de construction pour la modification/suppression des commandes.")
 
 
@@ -886,12 +1198,35 @@ def show_user_settings_page():
     """)
 
 
+def history_filters_sidebar():
+    """Filtres de l'historique lus dans la barre latérale, avant le chargement, pour être transmis à l'API."""
+    filters = {}
+    with st.sidebar.expander("Filtres de l'historique"):
+        periode = st.date_input("Période", value=(), key="hist_periode")
+        if len(periode) >= 1:
+            filters['date_from'] = datetime.combine(periode[0], time.min).isoformat()
+        if len(periode) == 2:
+            filters['date_to'] = datetime.combine(periode[1], time.max).isoformat()
+        
+        statut = st.selectbox("Statut", ["Tous"] + COMMANDE_STATUTS, key="hist_statut")
+        if statut != "Tous":
+            filters['statut'] = statut
+        
+        four_map = fournisseur_name_map()
+        fournisseur_id = st.selectbox(
+            "Fournisseur", [None] + list(four_map), key="hist_fournisseur",
+            format_func=lambda fid: "Tous" if fid is None else four_map.get(fid, fid)
+        )
+        if fournisseur_id is not None:
+            filters['fournisseur_id'] = fournisseur_id
+    return filters
+
 def show_client_page():
-    st.sidebar.title(f"Bienvenue, {get_display_name(st.session_state.username)}")
+    st.sidebar.title(f"Bienvenue, {st.session_state.display_name}")
     
     df_products = load_products_data()
     df_fournisseurs = load_fournisseurs_data()
-    commandes_data = load_commandes_data()
+    history_filters = history_filters_sidebar()
 
     tab1, tab2, tab3, tab4, tab5 = st.tabs([
         "📊 Tableau de Bord", 
@@ -906,13 +1241,13 @@ def show_client_page():
         st.info("Le tableau de bord est en cours de construction.")
         
     with tab2:
-        show_product_management(df_products, df_fournisseurs)
+        show_product_management(df_products)
         
     with tab3:
         show_fournisseur_management(df_fournisseurs)
         
     with tab4:
-        show_command_history(commandes_data, df_fournisseurs, df_products)
+        show_command_history(history_filters)
         
     with tab5:
         show_user_settings_page()
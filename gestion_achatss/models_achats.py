@@ -1,5 +1,5 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey
-from sqlalchemy.orm import relationship, DeclarativeBase
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Index, event
+from sqlalchemy.orm import relationship, DeclarativeBase, Session
 from datetime import datetime
 
 # =========================================================================
@@ -44,6 +44,11 @@ class Produit(Base):
 # =========================================================================
 class Commande(Base):
     __tablename__ = 'commandes'
+    # Index alignés sur les filtres de l'historique (fournisseur + période, statut)
+    __table_args__ = (
+        Index('ix_commandes_fourn_date', 'fournisseur_id', 'date_commande'),
+        Index('ix_commandes_statut', 'statut'),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     date_commande = Column(DateTime, default=datetime.utcnow)
@@ -57,9 +62,10 @@ class Commande(Base):
     # Clé étrangère vers le fournisseur
     fournisseur_id = Column(Integer, ForeignKey('fournisseurs.id'))
 
-    # Relations
-    fournisseur = relationship("Fournisseur", back_populates="commandes")
-    details = relationship("DetailCommande", back_populates="commande")
+    # Relations : le fournisseur (plusieurs-vers-un, une ligne par commande) est joint dans la même requête ;
+    # la collection des détails reste en "selectin" pour ne pas dupliquer les lignes de commande
+    fournisseur = relationship("Fournisseur", back_populates="commandes", lazy="joined", innerjoin=False)
+    details = relationship("DetailCommande", back_populates="commande", lazy="selectin")
 
 # =========================================================================
 # 5. Modèle DetailCommande (Order Detail)
@@ -72,9 +78,28 @@ class DetailCommande(Base):
     prix_achat = Column(Float, nullable=False) # Prix au moment de l'achat
 
     # Clés étrangères
-    commande_id = Column(Integer, ForeignKey('commandes.id'))
+    commande_id = Column(Integer, ForeignKey('commandes.id'), index=True) # Indexé pour le chargement "selectin" des détails
     produit_id = Column(Integer, ForeignKey('produits.id'))
 
     # Relations
     commande = relationship("Commande", back_populates="details")
-    produit = relationship("Produit", back_populates="details")
\ No newline at end of file
+    produit = relationship("Produit", back_populates="details")
+
+# =========================================================================
+# 6. Cohérence de Commande.cout_total
+# =========================================================================
+@event.listens_for(Session, "before_flush")
+def recalculer_cout_total(session, flush_context, instances):
+    """
+    Recalcule le coût total stocké des seules commandes dont un détail est ajouté, modifié ou supprimé.
+    Les lectures utilisent la colonne cout_total sans recharger les détails.
+    """
+    commandes = {
+        detail.commande
+        for detail in (*session.new, *session.dirty, *session.deleted)
+        if isinstance(detail, DetailCommande) and detail.commande is not None
+    }
+    for commande in commandes:
+        commande.cout_total = sum(
+            d.quantite * d.prix_achat for d in commande.details if d not in session.deleted
+        )